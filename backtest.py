@@ -1,7 +1,9 @@
 import logging
-import random
+from datetime import datetime
 
 from kuegi_bot.backtest_engine import BackTest
+from kuegi_bot.sweep_engine import run_sweep, grid, random_samples, format_metrics, walk_forward, run_search, \
+    SuccessiveHalving, EvolutionarySearch
 from kuegi_bot.bots.MultiStrategyBot import MultiStrategyBot
 from kuegi_bot.bots.strategies.MACross import MACross
 from kuegi_bot.bots.strategies.entry_filters import DayOfWeekFilter
@@ -33,42 +35,54 @@ def backtest(bars):
         BackTest(bot,bars).run()
 
 
-def increment(min,max,steps,current)->bool:
-    current[0] += steps[0]
-    for idx in range(len(current)):
-        if min[idx] <= current[idx] <= max[idx]:
-            return True
-        current[idx]= min[idx]
-        if idx < len(current)-1:
-            current[idx+1] += steps[idx+1]
-        else:
-            return False
+def opti_bot(params):
+    bot = MultiStrategyBot(logger=logger, directionFilter=0)
+    bot.add_strategy(KuegiStrategy()
+                     )
+    return bot
 
 
-def runOpti(bars,funding,min,max,steps,symbol= None, randomCount= -1):
-    v= min[:]
-    total= 1
+def runOpti(bars,funding,min,max,steps,symbol= None, randomCount= -1, workers= None, bot_factory= opti_bot,
+            search= None):
+    ''' search: None for the full grid (or randomCount random combinations), "halving" for successive halving
+    on them, "evolution" for a genetic search on the grid '''
     while len(steps) < len(min):
         steps.append(1)
-    for i in range(len(min)):
-        total *= 1+(max[i]-min[i])/steps[i]
+    if search == "evolution":
+        search= EvolutionarySearch(min,max,steps)
+    elif search == "halving":
+        search= SuccessiveHalving(random_samples(min,max,steps,randomCount) if randomCount > 0 else grid(min,max,steps))
+    if search is not None:
+        for params, fraction, metrics in run_search(bot_factory, bars, search, funding=funding, symbol=symbol,
+                                                    workers=workers):
+            logger.info("%.2f | %s" % (fraction, format_metrics(params, metrics)))
+        return
+    if randomCount > 0:
+        total= randomCount
+        combinations= random_samples(min,max,steps,randomCount)
+    else:
+        total= 1
+        for i in range(len(min)):
+            total *= 1+int((max[i]-min[i])/steps[i])
+        combinations= grid(min,max,steps)
     logger.info("running %d combinations" % total)
-    while True:
-        msg= ""
-        if randomCount > 0:
-            for i in range(len(v)):
-                v[i] = min[i] + random.randint(0, int((max[i] - min[i]) / steps[i])) * steps[i]
-            randomCount = randomCount-1
-        for i in v:
-            msg += str(i) + " "
-        logger.info(msg)
-        bot = MultiStrategyBot(logger=logger, directionFilter=0)
-        bot.add_strategy(KuegiStrategy()
-                         )
-        BackTest(bot, bars= bars,funding=funding, symbol=symbol).run()
+    for params, metrics in run_sweep(bot_factory, bars, combinations, funding=funding, symbol=symbol, workers=workers):
+        logger.info(format_metrics(params, metrics))
 
-        if randomCount == 0 or (randomCount < 0 and not increment(min,max,steps,v)):
-            break
+
+def runWalkForward(bars,funding,min,max,steps,train_bars,test_bars,step_bars= None,symbol= None, workers= None,
+                   bot_factory= opti_bot, indicator_cache= None):
+    while len(steps) < len(min):
+        steps.append(1)
+    result= walk_forward(bot_factory, bars, grid(min,max,steps), train_bars, test_bars, step_bars, funding=funding,
+                         symbol=symbol, workers=workers, indicator_cache=indicator_cache)
+    for fold in result["folds"]:
+        logger.info("%s - %s: %s" % (datetime.fromtimestamp(fold["test"][0]).isoformat(),
+                                     datetime.fromtimestamp(fold["test"][1]).isoformat(),
+                                     format_metrics(fold["params"], fold["out_of_sample"])))
+    if len(result["equity"]) > 0:
+        logger.info("out of sample equity: %.3f" % result["equity"][-1][1])
+    return result
 
 
 def checkDayFilterByDay(bars,symbol= None):
@@ -82,100 +96,103 @@ def checkDayFilterByDay(bars,symbol= None):
 
         b= BackTest(bot, bars,symbol).run()
 
-pair= "BTCUSD"
-pair= "BTCUSDT"
-#pair= "ETHUSD"
 
-exchange= 'bybit'
+# the workers of run_sweep import this file again (spawn/forkserver), so nothing must run on import
+if __name__ == '__main__':
+    pair= "BTCUSD"
+    pair= "BTCUSDT"
+    #pair= "ETHUSD"
+
+    exchange= 'bybit'
 
-tf= 240
-monthsBack= 18
+    tf= 240
+    monthsBack= 18
 
-if exchange == 'bybit' and "USDT" in pair:
-    exchange= 'bybit-linear'
+    if exchange == 'bybit' and "USDT" in pair:
+        exchange= 'bybit-linear'
 
-funding = load_funding(exchange,pair)
+    funding = load_funding(exchange,pair)
 
-#bars_p = load_bars(30 * 12, 240,0,'phemex')
-#bars_n = load_bars(30 * 12, 240,0,'binance_f')
-#bars_ns = load_bars(30 * 24, 240,0,'binanceSpot')
-bars_b = load_bars(30 * monthsBack, tf,0,exchange,pair)
-#bars_m = load_bars(30 * 12, 240,0,'bitmex')
+    #bars_p = load_bars(30 * 12, 240,0,'phemex')
+    #bars_n = load_bars(30 * 12, 240,0,'binance_f')
+    #bars_ns = load_bars(30 * 24, 240,0,'binanceSpot')
+    bars_b = load_bars(30 * monthsBack, tf,0,exchange,pair)
+    #bars_m = load_bars(30 * 12, 240,0,'bitmex')
 
-#bars_b = load_bars(30 * 12, 60,0,'bybit')
-#bars_m = load_bars(30 * 24, 60,0,'bitmex')
+    #bars_b = load_bars(30 * 12, 60,0,'bybit')
+    #bars_m = load_bars(30 * 24, 60,0,'bitmex')
 
-#bars1= load_bars(24)
-#bars2= process_low_tf_bars(m1_bars, 240, 60)
-#bars3= process_low_tf_bars(m1_bars, 240, 120)
-#bars4= process_low_tf_bars(m1_bars, 240, 180)
+    #bars1= load_bars(24)
+    #bars2= process_low_tf_bars(m1_bars, 240, 60)
+    #bars3= process_low_tf_bars(m1_bars, 240, 120)
+    #bars4= process_low_tf_bars(m1_bars, 240, 180)
 
-symbol=None
-if pair == "BTCUSD":
-    symbol=Symbol(symbol="BTCUSD", isInverse=True, tickSize=0.5, lotSize=1.0, makerFee=-0.025,takerFee=0.075, quantityPrecision=2,pricePrecision=2)
-elif pair == "XRPUSD":
-    symbol=Symbol(symbol="XRPUSD", isInverse=True, tickSize=0.0001, lotSize=0.01, makerFee=-0.025,takerFee=0.075, quantityPrecision=2,pricePrecision=4)
-elif pair == "ETHUSD":
-    symbol=Symbol(symbol="ETHUSD", isInverse=True, tickSize=0.01, lotSize=0.1, makerFee=-0.025,takerFee=0.075, quantityPrecision=2,pricePrecision=2)
-elif pair == "BTCUSDT":
-    symbol=Symbol(symbol="BTCUSDT", isInverse=False, tickSize=0.5, lotSize=0.0001, makerFee=-0.025,takerFee=0.075, quantityPrecision=5,pricePrecision=4)
+    symbol=None
+    if pair == "BTCUSD":
+        symbol=Symbol(symbol="BTCUSD", isInverse=True, tickSize=0.5, lotSize=1.0, makerFee=-0.025,takerFee=0.075, quantityPrecision=2,pricePrecision=2)
+    elif pair == "XRPUSD":
+        symbol=Symbol(symbol="XRPUSD", isInverse=True, tickSize=0.0001, lotSize=0.01, makerFee=-0.025,takerFee=0.075, quantityPrecision=2,pricePrecision=4)
+    elif pair == "ETHUSD":
+        symbol=Symbol(symbol="ETHUSD", isInverse=True, tickSize=0.01, lotSize=0.1, makerFee=-0.025,takerFee=0.075, quantityPrecision=2,pricePrecision=2)
+    elif pair == "BTCUSDT":
+        symbol=Symbol(symbol="BTCUSDT", isInverse=False, tickSize=0.5, lotSize=0.0001, makerFee=-0.025,takerFee=0.075, quantityPrecision=5,pricePrecision=4)
 
 
-#
-#for binance_f
-#symbol=Symbol(symbol="BTCUSDT", isInverse=False, tickSize=0.001, lotSize=0.00001, makerFee=0.02, takerFee=0.04, quantityPrecision=5)
+    #
+    #for binance_f
+    #symbol=Symbol(symbol="BTCUSDT", isInverse=False, tickSize=0.001, lotSize=0.00001, makerFee=0.02, takerFee=0.04, quantityPrecision=5)
 
-bars_full= bars_b
-oos_cut=int(len(bars_full)/4)
-bars= bars_full[oos_cut:]
-bars_oos= bars_full[:oos_cut]
+    bars_full= bars_b
+    oos_cut=int(len(bars_full)/4)
+    bars= bars_full[oos_cut:]
+    bars_oos= bars_full[:oos_cut]
 
 
-'''
-checkDayFilterByDay(bars,symbol=symbol)
+    '''
+    checkDayFilterByDay(bars,symbol=symbol)
 
-#'''
+    #'''
 
-'''
-# profiling stats
-# run it `python -m cProfile -o profile.data backtest.py`
+    '''
+    # profiling stats
+    # run it `python -m cProfile -o profile.data backtest.py`
 
-import pstats
-from pstats import SortKey
-p = pstats.Stats('profile.data')
-p.strip_dirs() # remove extra paths
+    import pstats
+    from pstats import SortKey
+    p = pstats.Stats('profile.data')
+    p.strip_dirs() # remove extra paths
 
-p.sort_stats(SortKey.CUMULATIVE).print_stats(20)
-p.sort_stats(SortKey.TIME).print_stats(10)
+    p.sort_stats(SortKey.CUMULATIVE).print_stats(20)
+    p.sort_stats(SortKey.TIME).print_stats(10)
 
-p.print_callers('<functionName>')
-'''
+    p.print_callers('<functionName>')
+    '''
 
-'''
-runOpti(bars_oos, funding=funding,
-        min=   [-5,20],
-        max=   [5,27],
-        steps= [1,1],
-        randomCount=-1,
-        symbol=symbol)
+    '''
+    runOpti(bars_oos, funding=funding,
+            min=   [-5,20],
+            max=   [5,27],
+            steps= [1,1],
+            randomCount=-1,
+            symbol=symbol)
 
-#'''
+    #'''
 
-#'''
+    #'''
 
-bot=MultiStrategyBot(logger=logger, directionFilter= 0)
-bot.add_strategy(KuegiStrategy()
-                 )
+    bot=MultiStrategyBot(logger=logger, directionFilter= 0)
+    bot.add_strategy(KuegiStrategy()
+                     )
 
-bot.add_strategy(SfpStrategy()
-                 )
+    bot.add_strategy(SfpStrategy()
+                     )
 
-b= BackTest(bot, bars_full, funding=funding, symbol=symbol,market_slipage_percent=0.15).run()
+    b= BackTest(bot, bars_full, funding=funding, symbol=symbol,market_slipage_percent=0.15).run()
 
-#performance chart with lots of numbers
-bot.create_performance_plot(bars).show()
+    #performance chart with lots of numbers
+    bot.create_performance_plot(bars).show()
 
-# chart with signals:
-b.prepare_plot().show()
+    # chart with signals:
+    b.prepare_plot().show()
 
-#'''
+    #'''
@@ -18,6 +18,7 @@ from kuegi_bot.utils import log
 from kuegi_bot.utils.telegram import TelegramBot
 from kuegi_bot.utils.dotdict import dotdict
 from kuegi_bot.utils.helper import load_settings_from_args
+from kuegi_bot.utils.market_data import hub_for
 from kuegi_bot.bots.strategies.MACross import MACross
 
 
@@ -45,7 +46,8 @@ def start_bot(botSettings,telegram:TelegramBot=None):
                 strat = MACross(fastMA = stratSettings.MAC_FAST_MA,
                                 slowMA =stratSettings.MAC_SLOW_MA,
                                 swingBefore = stratSettings.MAC_SWING_BEFORE,
-                                swingAfter = stratSettings.MAC_SWING_AFTER)
+                                swingAfter = stratSettings.MAC_SWING_AFTER,
+                                hmaType = stratSettings.MAC_HMA_TYPE)
             elif stratId == "kuegi":
                 strat = KuegiStrategy(min_channel_size_factor=stratSettings.KB_MIN_CHANNEL_SIZE_FACTOR,
                                       max_channel_size_factor=stratSettings.KB_MAX_CHANNEL_SIZE_FACTOR,
@@ -121,7 +123,8 @@ def start_bot(botSettings,telegram:TelegramBot=None):
                 bot.add_strategy(strat)
     else:
         logger.error("only multistrat bot supported")
-    live = LiveTrading(settings=botSettings, trading_bot=bot,telegram=telegram)
+    live = LiveTrading(settings=botSettings, trading_bot=bot,telegram=telegram,
+                       market_data=hub_for(marketDataHubs, botSettings))
     t = threading.Thread(target=live.run_loop)
     t.bot: LiveTrading = live
     t.originalSettings= originalSettings
@@ -261,6 +264,7 @@ def run(settings):
 
 
 activeThreads: List[threading.Thread] = []
+marketDataHubs = {}  # one per exchange and symbol, shared by the bots trading it
 logger = None
 
 if __name__ == '__main__':
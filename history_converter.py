@@ -0,0 +1,12 @@
+import sys
+
+from kuegi_bot.utils.helper import convert_history_to_npy
+
+# converts the json history files of the crawler into one binary file per symbol, which loads a lot faster.
+# usage: python history_converter.py <exchange> <symbol>
+
+exchange = sys.argv[1] if len(sys.argv) > 1 else 'bybit'
+symbol = sys.argv[2] if len(sys.argv) > 2 else 'BTCUSD'
+print("converting history of " + exchange + " " + symbol)
+
+convert_history_to_npy(exchange, symbol)
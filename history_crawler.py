@@ -11,7 +11,7 @@ from datetime import datetime
 # ====================================
 #
 # api-endpoint
-from kuegi_bot.utils.helper import history_file_name, known_history_files
+from kuegi_bot.utils.helper import history_file_name, last_history_file_index, update_history_manifest
 from kuegi_bot.utils.trading_classes import parse_utc_timestamp
 
 exchange = sys.argv[1] if len(sys.argv) > 1 else 'bybit'
@@ -50,15 +50,14 @@ elif exchange == 'bitstamp':
 offset = 0
 
 # init
-# TODO: adapt this to your number if you already have history files
-
-lastknown = known_history_files[exchange+"_"+symbol] if exchange+"_"+symbol in known_history_files else -1
 
 try:
     os.makedirs('history/'+exchange)
 except Exception:
     pass
 
+lastknown = last_history_file_index(exchange,symbol)
+
 if lastknown >= 0:
     try:
         with open(history_file_name(lastknown,exchange,symbol), 'r') as file:
@@ -139,9 +138,11 @@ while True:
         idx= max - 2
         while idx < max:
             if idx*batchsize-offset >= 0:
+                rows= result[idx*batchsize-offset:(idx+1)*batchsize-offset]
                 with open(history_file_name(idx,exchange,symbol),'w') as file:
-                    json.dump(result[idx*batchsize-offset:(idx+1)*batchsize-offset],file)
+                    json.dump(rows,file)
                     print("wrote file "+str(idx))
+                update_history_manifest(exchange,symbol,idx,rows)
             idx += 1
 
     if not wasOk:
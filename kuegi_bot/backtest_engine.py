@@ -2,15 +2,23 @@ import logging
 import math
 import os
 import csv
+from functools import reduce
+from operator import add
 
+import numpy as np
 import plotly.graph_objects as go
 
 from typing import List
 from datetime import datetime
 
 from kuegi_bot.bots.trading_bot import TradingBot, PositionDirection
+from kuegi_bot.indicators.cache import IndicatorCache
 from kuegi_bot.utils.trading_classes import OrderInterface, Bar, Account, Order, Symbol, AccountPosition, \
-    PositionStatus, OrderType
+    PositionStatus, OrderType, Position
+from kuegi_bot.utils.bar_window import BarWindow
+from kuegi_bot.utils.bar_store import SubbarView
+from kuegi_bot.utils.order_book import OrderBook
+from kuegi_bot.utils.result_cache import ResultCache, canonical, bars_fingerprint, fingerprint
 from kuegi_bot.utils import log
 
 
@@ -32,8 +40,13 @@ class SilentLogger(object):
 class BackTest(OrderInterface):
 
     def __init__(self, bot: TradingBot, bars: list, funding: dict = None, symbol: Symbol = None,
-                 market_slipage_percent=0.15):
+                 market_slipage_percent=0.15, indicator_cache: IndicatorCache = None,
+                 result_cache: ResultCache = None):
         self.bars: List[Bar] = bars
+        self.indicator_cache = indicator_cache
+        self.result_cache = result_cache
+        # configuration of the bot before it gets prepared and initialized, part of the fingerprint
+        self.bot_config = canonical(bot) if result_cache is not None else None
         self.funding = funding
         self.firstFunding = 9999999999
         self.lastFunding = 0
@@ -67,6 +80,10 @@ class BackTest(OrderInterface):
         self.lastHHPosition = 0
 
         self.current_bars: List[Bar] = []
+        # (tstamp, equity) at the end of every bar of the last run
+        self.equity_curve: list = []
+        # summary of the last run: profit, maxDD, rel, uw_days, trades
+        self.metrics: dict = {}
 
         self.reset()
 
@@ -82,11 +99,15 @@ class BackTest(OrderInterface):
         self.lastHHPosition = 0
         self.underwater = 0
         self.maxExposure = 0
+        self.order_book = OrderBook()
+        self.equity_curve = []
         self.bot.reset()
 
         self.current_bars = []
         for b in self.bars:
             b.did_change = True
+        if self.indicator_cache is not None:
+            self.bot.use_indicator_cache(self.indicator_cache, self.bars)
         self.bot.init(self.bars[-self.bot.min_bars_needed():], self.account, self.symbol, None)
 
     # implementing OrderInterface
@@ -109,12 +130,15 @@ class BackTest(OrderInterface):
         order.tstamp = self.current_bars[0].tstamp
         if order not in self.account.open_orders:  # bot might add it himself temporarily.
             self.account.open_orders.append(order)
+        if order not in self.order_book:
+            self.order_book.add(order)
 
     def update_order(self, order: Order):
         for existing_order in self.account.open_orders:
             if existing_order.id == order.id:
                 self.account.open_orders.remove(existing_order)
                 self.account.open_orders.append(order)
+                self.order_book.update(order)
                 order.tstamp = self.current_bars[0].last_tick_tstamp
                 self.logger.debug("updated order %s" % (order.print_info()))
                 break
@@ -128,6 +152,7 @@ class BackTest(OrderInterface):
 
                 self.account.order_history.append(order)
                 self.account.open_orders.remove(order)
+                self.order_book.remove(order)
                 self.logger.debug("canceled order " + order_to_cancel.id)
                 break
 
@@ -178,6 +203,7 @@ class BackTest(OrderInterface):
         self.bot.on_execution(order_id=order.id, amount=amount, executed_price=price, tstamp=intrabar.tstamp)
         self.account.order_history.append(order)
         self.account.open_orders.remove(order)
+        self.order_book.remove(order)
         self.logger.debug(
             "executed order %s | %.0f %.2f | %.2f@ %.1f" % (
                 order.id, self.account.usd_equity, self.account.open_position.quantity, order.executed_amount,
@@ -203,9 +229,9 @@ class BackTest(OrderInterface):
     def check_executions(self, intrabar_to_check: Bar, only_on_close):
         another_round = True
         did_something = False
+        # orders that come in during the checks of this bar can only be executed on close.
+        # till the first execution the book is unchanged, so the ids are only collected then
         allowed_order_ids = None
-        if not only_on_close:
-            allowed_order_ids = set(map(lambda o: o.id, self.account.open_orders))
         loopbreak = 0
         while another_round:
             if loopbreak > 100:
@@ -214,7 +240,8 @@ class BackTest(OrderInterface):
             loopbreak += 1
             another_round = False
             should_execute = False
-            for order in sorted(self.account.open_orders, key=self.orderKeyForSort):
+            candidates = self.order_book.candidates(intrabar_to_check.high, intrabar_to_check.low)
+            for order in sorted(candidates, key=lambda o: (self.orderKeyForSort(o), self.order_book.seq(o))):
                 if allowed_order_ids is not None and order.id not in allowed_order_ids:
                     continue
                 force_taker = False
@@ -227,6 +254,7 @@ class BackTest(OrderInterface):
                     if (order.amount > 0 and order.stop_price < intrabar_to_check.high) or (
                             order.amount < 0 and order.stop_price > intrabar_to_check.low):
                         order.stop_triggered = True
+                        self.order_book.reindex(order)
                         something_changed = True
                         if order.limit_price is None:
                             # execute stop market
@@ -250,6 +278,8 @@ class BackTest(OrderInterface):
                         should_execute = True
 
                 if should_execute:
+                    if allowed_order_ids is None and not only_on_close:
+                        allowed_order_ids = set(map(lambda o: o.id, self.account.open_orders))
                     self.handle_order_execution(order, intrabar_to_check, force_taker=force_taker)
                     self.bot.on_tick(self.current_bars, self.account)
                     another_round = True
@@ -257,6 +287,92 @@ class BackTest(OrderInterface):
                     break
         return did_something
 
+    def handle_subbars(self, bar: Bar):
+        ''' runs the subbars of the bar. while the bot only waits for its orders, the subbars till the first one
+        that touches an order are skipped in one go '''
+        subbars = bar.subbars
+        count = len(subbars)
+        # stored subbars are read directly from the columns
+        arrays = self.subbar_arrays(bar) if isinstance(subbars, SubbarView) else None
+        idx = 0  # oldest first
+        while idx < count:
+            if self.account.open_position.quantity == 0 and not self.bot.needs_intrabar_ticks(self.account):
+                if arrays is None:
+                    arrays = self.subbar_arrays(bar)
+                touch = self.first_touch(arrays, idx)
+                if touch > idx:
+                    self.skip_to_subbar(bar, arrays, idx, touch)
+                    idx = touch
+                    if idx == count:
+                        break
+            if isinstance(subbars, SubbarView):
+                subbar = self.subbar_from_arrays(arrays, idx)
+            else:
+                subbar = subbars[count - 1 - idx]
+                # ensure correct last tick (must not be the same as tstamp)
+                if subbar.last_tick_tstamp < subbar.tstamp + 59:
+                    subbar.last_tick_tstamp = subbar.tstamp + 59
+            # check open orders & update account
+            self.handle_subbar(subbar)
+            self.current_bars[1].did_change = False
+            idx += 1
+
+    SUBBAR_COLUMNS = ("tstamp", "open", "high", "low", "close", "volume", "last_tick_tstamp")
+
+    @staticmethod
+    def subbar_arrays(bar: Bar) -> list:
+        ''' tstamp, open, high, low, close, volume and last tick of the subbars as arrays, oldest first.
+        no copy if the subbars are stored in columns already '''
+        subbars = bar.subbars
+        if isinstance(subbars, SubbarView):
+            return subbars.columns(BackTest.SUBBAR_COLUMNS)
+        count = len(subbars)
+        return [np.fromiter((getattr(subbars[idx], attr) for idx in range(count - 1, -1, -1)), dtype=np.float64,
+                            count=count)
+                for attr in BackTest.SUBBAR_COLUMNS]
+
+    @staticmethod
+    def subbar_from_arrays(arrays: list, idx: int) -> Bar:
+        ''' the subbar idx (oldest first) as Bar, with the last tick at the end of the minute at least '''
+        tstamps, opens, highs, lows, closes, volumes, last_ticks = arrays
+        tstamp = tstamps.item(idx)
+        subbar = Bar(tstamp=tstamp, open=opens.item(idx), high=highs.item(idx), low=lows.item(idx),
+                     close=closes.item(idx), volume=volumes.item(idx))
+        subbar.last_tick_tstamp = max(last_ticks.item(idx), tstamp + 59)
+        return subbar
+
+    def first_touch(self, arrays: list, start: int) -> int:
+        ''' index (oldest first) of the first subbar from start on that could trigger or fill an open order '''
+        trigger_range = self.order_book.trigger_range()
+        if trigger_range is None:
+            return start  # market order
+        up, down = trigger_range
+        touched = (arrays[2][start:] > up) | (arrays[3][start:] < down)
+        return start + int(touched.argmax()) if touched.any() else len(touched) + start
+
+    def skip_to_subbar(self, bar: Bar, arrays: list, start: int, stop: int):
+        ''' same result as handle_subbar for the subbars start to stop (excl., oldest first) of the bar if they
+        don't touch any order and the bot is flat and doesn't need the ticks '''
+        tstamps, opens, highs, lows, closes, volumes, last_ticks = arrays
+        subbars = bar.subbars
+        forming = self.current_bars[0]
+        forming.high = max(forming.high, highs[start:stop].max().item())
+        forming.low = min(forming.low, lows[start:stop].min().item())
+        forming.close = closes.item(stop - 1)
+        forming.volume = reduce(add, volumes[start:stop].tolist(), forming.volume)
+        forming.subbars[0:0] = subbars[len(subbars) - stop:len(subbars) - start]
+        forming.last_tick_tstamp = max(forming.last_tick_tstamp,
+                                       np.maximum(last_ticks[start:stop], tstamps[start:stop] + 59).max().item())
+        forming.did_change = True
+        self.current_bars[1].did_change = False
+
+        self.account.equity = self.account.open_position.walletBalance
+        self.account.usd_equity = self.account.equity * forming.close
+        self.update_stats()
+        if self.underwater > 0:
+            self.underwater += stop - start - 1
+            self.max_underwater = max(self.max_underwater, self.underwater)
+
     def handle_subbar(self, intrabarToCheck: Bar):
         self.current_bars[0].add_subbar(intrabarToCheck)  # so bot knows about the current intrabar
         # first the ones that are there at the beginning
@@ -280,6 +396,25 @@ class BackTest(OrderInterface):
 
         self.update_stats()
 
+    def is_idle(self) -> bool:
+        ''' nothing can happen until the next bar: no orders to execute, no position and the bot doesn't need the
+        intrabar ticks '''
+        return len(self.account.open_orders) == 0 and self.account.open_position.quantity == 0 \
+            and not self.bot.needs_intrabar_ticks(self.account)
+
+    def skip_subbars(self, bar: Bar):
+        ''' same result as handle_subbar for all subbars of the bar when idle: the equity stays the same,
+        only the underwater time goes on '''
+        if len(bar.subbars) == 0:
+            return
+        self.current_bars[1].did_change = False
+        self.account.equity = self.account.open_position.walletBalance
+        self.account.usd_equity = self.account.equity * bar.subbars[0].close
+        self.update_stats()
+        if self.underwater > 0:
+            self.underwater += len(bar.subbars) - 1
+            self.max_underwater = max(self.max_underwater, self.underwater)
+
     def update_stats(self):
 
         if math.fabs(
@@ -313,7 +448,50 @@ class BackTest(OrderInterface):
         if funding != 0 and self.account.open_position.quantity != 0:
             self.account.open_position.walletBalance -= funding * self.account.open_position.quantity / bar.open
 
+    def fingerprint(self) -> str:
+        ''' identifies the result of a run: the bars, symbol, fees, slipage, funding, the configuration of the bot and
+        if the indicators were warmed up from an indicator cache '''
+        return fingerprint({"bars": bars_fingerprint(self.bars),
+                            "symbol": canonical(self.symbol),
+                            "fees": canonical([self.maker_fee, self.taker_fee, self.market_slipage_percent]),
+                            "funding": canonical(self.funding),
+                            "equity": canonical(self.initialEquity),
+                            "bot": self.bot_config,
+                            "indicator_cache": self.indicator_cache is not None})
+
+    def result(self) -> dict:
+        return {"metrics": self.metrics,
+                "trades": [pos.to_json() for pos in self.bot.position_history],
+                "equity_curve": self.equity_curve,
+                "equity": self.account.equity,
+                "hh": self.hh,
+                "maxDD": self.maxDD,
+                "max_underwater": self.max_underwater,
+                "maxExposure": self.maxExposure}
+
+    def restore_result(self, result: dict):
+        self.metrics = result["metrics"]
+        self.bot.position_history = [Position.from_json(pos) for pos in result["trades"]]
+        self.equity_curve = [tuple(entry) for entry in result["equity_curve"]]
+        self.account.equity = result["equity"]
+        self.hh = result["hh"]
+        self.maxDD = result["maxDD"]
+        self.max_underwater = result["max_underwater"]
+        self.maxExposure = result["maxExposure"]
+
+    def run_cached(self):
+        ''' like run, but takes the result from the result cache if the same run was done before.
+        only the result gets restored (metrics, trades, equity curve), not the indicators or open positions,
+        so this is for sweeps. plots need a full run '''
+        if self.result_cache is not None:
+            cached = self.result_cache.load(self.fingerprint())
+            if cached is not None:
+                self.restore_result(cached)
+                return self
+        return self.run()
+
     def run(self):
+        ''' runs the full backtest. with a result cache, the result gets stored for run_cached '''
         self.reset()
         self.logger.info(
             "starting backtest with " + str(len(self.bars)) + " bars and " + str(self.account.equity) + " equity")
@@ -321,28 +499,25 @@ class BackTest(OrderInterface):
             if i == len(self.bars) - 1 or i < self.bot.min_bars_needed():
                 continue  # ignore last bar and first x
 
-            # slice bars. TODO: also slice intrabar to simulate tick
-            self.current_bars = self.bars[-(i + 1):]
             # add one bar with 1 tick on open to show to bot that the old one is closed
             next_bar = self.bars[-i - 2]
             forming_bar = Bar(tstamp=next_bar.tstamp, open=next_bar.open, high=next_bar.open,
                               low=next_bar.open, close=next_bar.open,
                               volume=0, subbars=[])
-            self.current_bars.insert(0, forming_bar)
+            # window on the last i+1 bars with the forming bar in front. TODO: also slice intrabar to simulate tick
+            self.current_bars = BarWindow(self.bars, len(self.bars) - (i + 1), head=forming_bar)
             self.current_bars[0].did_change = True
             self.current_bars[1].did_change = True
 
             self.do_funding()
             self.bot.on_tick(self.current_bars, self.account)  # tick on new bar open cause many strats act on that
-            for subbar in reversed(next_bar.subbars):
-                # check open orders & update account
-                # ensure correct last tick (must not be the same as tstamp)
-                if subbar.last_tick_tstamp < subbar.tstamp + 59:
-                    subbar.last_tick_tstamp = subbar.tstamp + 59
-                self.handle_subbar(subbar)
-                self.current_bars[1].did_change = False
+            if self.is_idle():
+                self.skip_subbars(next_bar)
+            else:
+                self.handle_subbars(next_bar)
 
             next_bar.bot_data = forming_bar.bot_data
+            self.equity_curve.append((next_bar.tstamp, self.account.equity))
             for b in self.current_bars:
                 if b.did_change:
                     b.did_change = False
@@ -352,7 +527,22 @@ class BackTest(OrderInterface):
         if abs(self.account.open_position.quantity) > self.symbol.lotSize / 10:
             self.send_order(Order(orderId="endOfTest", amount=-self.account.open_position.quantity))
             self.handle_subbar(self.bars[0].subbars[-1])
-
+            if len(self.equity_curve) > 0:
+                self.equity_curve[-1] = (self.equity_curve[-1][0], self.account.equity)
+
+        if self.indicator_cache is not None:
+            self.bot.save_indicator_cache(self.bars)
+
+        profit = self.account.equity - self.initialEquity
+        uw_updates_per_day = 1440  # every minute
+        total_days = (self.bars[0].tstamp - self.bars[-1].tstamp) / (60 * 60 * 24)
+        rel = profit / (self.maxDD if self.maxDD > 0 else 1)
+        rel_per_year = rel / (total_days / 365) if total_days > 0 else 0  # a single bar covers no time
+        self.metrics = {"profit": 100 * profit / self.initialEquity,
+                        "maxDD": 100 * self.maxDD / self.initialEquity,
+                        "rel": rel_per_year,
+                        "uw_days": self.max_underwater / uw_updates_per_day,
+                        "trades": len(self.bot.position_history)}
         if len(self.bot.position_history) > 0:
             daysInPos = 0
             maxDays = 0
@@ -367,11 +557,6 @@ class BackTest(OrderInterface):
                 minDays = min(minDays, pos.daysInPos())
             daysInPos /= len(self.bot.position_history)
 
-            profit = self.account.equity - self.initialEquity
-            uw_updates_per_day = 1440  # every minute
-            total_days = (self.bars[0].tstamp - self.bars[-1].tstamp) / (60 * 60 * 24)
-            rel = profit / (self.maxDD if self.maxDD > 0 else 1)
-            rel_per_year = rel / (total_days / 365)
             self.logger.info("finished | closed pos: " + str(len(self.bot.position_history))
                              + " | open pos: " + str(len(self.bot.open_positions))
                              + " | profit: " + ("%.2f" % (100 * profit / self.initialEquity))
@@ -385,6 +570,9 @@ class BackTest(OrderInterface):
         else:
             self.logger.info("finished with no trades")
 
+        if self.result_cache is not None:
+            self.result_cache.save(self.fingerprint(), self.result())
+
         # self.write_results_to_files()
         return self
 
@@ -4,7 +4,8 @@ from random import randint
 
 import plotly.graph_objects as go
 from kuegi_bot.bots.trading_bot import TradingBot
-from kuegi_bot.utils.trading_classes import Position, Account, Bar, Symbol
+from kuegi_bot.indicators.registry import IndicatorRegistry
+from kuegi_bot.utils.trading_classes import Position, Account, Bar, Symbol, PositionStatus, OrderType
 from kuegi_bot.utils.telegram import TelegramBot
 from typing import List
 
@@ -19,6 +20,7 @@ class Strategy:
         self.atr_factor_risk = 1
         self.max_risk_mul = 1
         self.telegram: TelegramBot = None
+        self.indicator_registry: IndicatorRegistry = None
 
     def myId(self):
         return "gen"
@@ -35,12 +37,23 @@ class Strategy:
         self.logger = logger
         self.order_interface = order_interface
 
+    def register_indicators(self, registry: IndicatorRegistry):
+        ''' called by the bot before init. strategies replace their indicators with the shared ones from the
+        registry (registry.get). the registry then calculates them, so the strategy must not do it anymore.
+        '''
+        self.indicator_registry = registry
+
     def init(self, bars: List[Bar], account: Account, symbol: Symbol):
         self.symbol = symbol
 
     def min_bars_needed(self) -> int:
         return 5
 
+    def needs_intrabar_ticks(self) -> bool:
+        ''' False if the strategy only opens orders on a new bar and doesn't manage pending entries intrabar,
+        so it doesn't need intrabar ticks while it has no open positions '''
+        return True
+
     def owns_signal_id(self, signalId: str):
         return signalId.startswith(self.myId() + "+")
 
@@ -97,6 +110,7 @@ class Strategy:
 class MultiStrategyBot(TradingBot):
 
     def __init__(self, logger=None, directionFilter=0):
+        self.indicators = IndicatorRegistry()  # before super().__init__, which calls reset
         super().__init__(logger, directionFilter)
         self.myId = "MultiStrategy"
         self.strategies: List[Strategy] = []
@@ -108,12 +122,31 @@ class MultiStrategyBot(TradingBot):
         super().prepare(logger, order_interface)
         for strat in self.strategies:
             strat.prepare(logger, order_interface)
+        self.register_indicators(self.indicators)
+
+    def register_indicators(self, registry: IndicatorRegistry):
+        for strat in self.strategies:
+            strat.register_indicators(registry)
+
+    def reset(self):
+        super().reset()
+        self.indicators.clear()
+
+    def limit_indicator_rows(self, max_rows: int):
+        self.indicators.limit_rows(max_rows)
+
+    def use_indicator_cache(self, cache, bars: List[Bar]):
+        self.indicators.use_cache(cache, bars)
+
+    def save_indicator_cache(self, bars: List[Bar]):
+        self.indicators.save_cache(bars)
 
     def init(self, bars: List[Bar], account: Account, symbol: Symbol, unique_id: str = ""):
         self.logger.info(
             "init with strategies: %s" % reduce((lambda result, strategy: result + ", " + strategy.myId()),
                                                 self.strategies,
                                                 ""))
+        self.indicators.on_tick(bars)
         for strat in self.strategies:
             strat.init(bars, account, symbol)
         super().init(bars=bars, account=account, symbol=symbol, unique_id=unique_id)
@@ -121,10 +154,32 @@ class MultiStrategyBot(TradingBot):
     def min_bars_needed(self):
         return reduce(lambda x, y: max(x, y.min_bars_needed()), self.strategies, 5)
 
+    def needs_intrabar_ticks(self, account: Account) -> bool:
+        # pending entries only wait for execution, everything else gets managed intrabar
+        if account.open_position.quantity != 0:
+            return True
+        for pos in self.open_positions.values():
+            if pos.status != PositionStatus.PENDING:
+                return True
+        entry_ids = set()
+        for order in account.open_orders:
+            pos = self.open_positions.get(self.position_id_from_order_id(order.id))
+            if pos is None or self.order_type_from_order_id(order.id) != OrderType.ENTRY:
+                return True
+            entry_ids.add(pos.id)
+        if len(entry_ids) != len(self.open_positions):
+            return True  # position without entry order, needs a sync
+        for strat in self.strategies:
+            if strat.needs_intrabar_ticks():
+                return True
+        return False
+
     def prep_bars(self, bars: list):
         newbar = self.is_new_bar
         if not self.got_data_for_position_sync(bars):
             newbar = True
+        if newbar:
+            self.indicators.on_tick(bars)
         for strategy in self.strategies:
             strategy.prep_bars(newbar, bars)
 
@@ -54,12 +54,16 @@ class BotWithChannel(TradingBot):
                               self.risk_factor, self.max_risk_mul, self.risk_type,
                               self.be_factor, self.be_buffer,
                               self.trail_active, self.delayed_swing_trail, self.trail_to_swing, self.trail_back))
+            self.channel.clear()
             self.channel.on_tick(bars)
         super().init(bars=bars, account=account, symbol=symbol, unique_id=unique_id)
 
     def min_bars_needed(self):
         return self.channel.max_look_back + 1
 
+    def limit_indicator_rows(self, max_rows: int):
+        self.channel.limit_rows(max_rows)
+
     def prep_bars(self, bars: list):
         if self.is_new_bar:
             self.channel.on_tick(bars)
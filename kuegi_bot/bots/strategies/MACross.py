@@ -4,6 +4,7 @@ import plotly.graph_objects as go
 
 from kuegi_bot.bots.strategies.strat_with_exit_modules import StrategyWithExitModulesAndFilter
 from kuegi_bot.bots.trading_bot import TradingBot, PositionDirection
+from kuegi_bot.indicators.HMA import HMA
 from kuegi_bot.indicators.indicator import SMA, BarSeries, highest, lowest
 from kuegi_bot.indicators.swings import Swings, Data
 from kuegi_bot.utils.trading_classes import Bar, Account, Symbol, OrderType, Position, Order, PositionStatus
@@ -11,32 +12,58 @@ from kuegi_bot.utils.trading_classes import Bar, Account, Symbol, OrderType, Pos
 
 class MACross(StrategyWithExitModulesAndFilter):
 
-    def __init__(self, fastMA: int = 8, slowMA: int = 34, swingBefore: int = 3, swingAfter: int = 2):
+    def __init__(self, fastMA: int = 8, slowMA: int = 34, swingBefore: int = 3, swingAfter: int = 2,
+                 hmaType: int = None):
+        ''' hmaType None uses SMAs, otherwise HMAs with this maType '''
         super().__init__()
-        self.fastMA = SMA(fastMA)
-        self.slowMA = SMA(slowMA)
+        self.hmaType = hmaType
+        if hmaType is None:
+            self.fastMA = SMA(fastMA)
+            self.slowMA = SMA(slowMA)
+        else:
+            self.fastMA = HMA(fastMA, hmaType)
+            self.slowMA = HMA(slowMA, hmaType)
         self.swings = Swings(swingBefore, swingAfter)
 
     def myId(self):
+        if self.hmaType is not None:
+            return "MACross(%d,%d,%d,%d,HMA%d)" % (self.fastMA.period, self.slowMA.period,
+                                                  self.swings.before, self.swings.after, self.hmaType)
         return "MACross(%d,%d,%d,%d)" % (self.fastMA.period, self.slowMA.period, self.swings.before, self.swings.after)
 
+    def ma_value(self, ma, bar: Bar):
+        data = ma.get_data(bar)
+        if self.hmaType is not None and data is not None:
+            return data.hma
+        return data
+
+    def register_indicators(self, registry):
+        super().register_indicators(registry)
+        self.fastMA = registry.get(self.fastMA)
+        self.slowMA = registry.get(self.slowMA)
+        self.swings = registry.get(self.swings)
+
     def init(self, bars: List[Bar], account: Account, symbol: Symbol):
         super().init(bars, account, symbol)
         self.logger.info("init with %d,%d,%d,%d" %
                          (self.fastMA.period, self.slowMA.period, self.swings.before, self.swings.after))
-        self.fastMA.on_tick(bars)
-        self.slowMA.on_tick(bars)
-        self.swings.on_tick(bars)
+        if self.indicator_registry is None:
+            self.fastMA.on_tick(bars)
+            self.slowMA.on_tick(bars)
+            self.swings.on_tick(bars)
 
     def min_bars_needed(self) -> int:
         return max(self.fastMA.period, self.slowMA.period, self.swings.before + self.swings.after) + 1
 
+    def needs_intrabar_ticks(self) -> bool:
+        return False  # only opens orders on a new bar
+
     def got_data_for_position_sync(self, bars: List[Bar]) -> bool:
         result = super().got_data_for_position_sync(bars)
         return result and (self.swings.get_data(bars[1]) is not None)
 
     def prep_bars(self, is_new_bar: bool, bars: list):
-        if is_new_bar:
+        if is_new_bar and self.indicator_registry is None:
             self.fastMA.on_tick(bars)
             self.slowMA.on_tick(bars)
             self.swings.on_tick(bars)
@@ -76,10 +103,10 @@ class MACross(StrategyWithExitModulesAndFilter):
 
         # check for signal. we are at the open of the new bar. so bars[0] contains of only 1 tick.
         # we look at data bars[1] and bars[2]
-        prevFast = self.fastMA.get_data(bars[2])
-        currentFast = self.fastMA.get_data(bars[1])
-        prevSlow = self.slowMA.get_data(bars[2])
-        currentSlow = self.slowMA.get_data(bars[1])
+        prevFast = self.ma_value(self.fastMA, bars[2])
+        currentFast = self.ma_value(self.fastMA, bars[1])
+        prevSlow = self.ma_value(self.slowMA, bars[2])
+        currentSlow = self.ma_value(self.slowMA, bars[1])
         swingData: Data = self.swings.get_data(bars[1])  # for stops
 
         # include the expected slipage in the risk calculation
@@ -24,20 +24,28 @@ class MeanReversion(StrategyWithExitModulesAndFilter):
     def myId(self):
         return "MeanRev"
 
+    def register_indicators(self, registry):
+        super().register_indicators(registry)
+        self.mean = registry.get(self.mean)
+
     def init(self, bars: List[Bar], account: Account, symbol: Symbol):
         super().init(bars, account, symbol)
         self.logger.info(f"init with {self.mean.period},{self.entry_factor},{self.tp_factor},{self.sl_factor}")
-        self.mean.on_tick(bars)
+        if self.indicator_registry is None:
+            self.mean.on_tick(bars)
 
     def min_bars_needed(self) -> int:
         return self.mean.period + 1
 
+    def needs_intrabar_ticks(self) -> bool:
+        return False  # only opens orders on a new bar
+
     def got_data_for_position_sync(self, bars: List[Bar]) -> bool:
         result = super().got_data_for_position_sync(bars)
         return result and (self.mean.get_data(bars[1]) is not None)
 
     def prep_bars(self, is_new_bar: bool, bars: list):
-        if is_new_bar:
+        if is_new_bar and self.indicator_registry is None:
             self.mean.on_tick(bars)
 
     def owns_signal_id(self, signalId: str):
@@ -121,8 +129,6 @@ class MeanReversion(StrategyWithExitModulesAndFilter):
                 gotLong= True
                 if pos.status == PositionStatus.PENDING:
                     pos.amount= longAmount
-                    pos.initialStop= longStop
-                    pos.wantedEntry= longEntry
                     for order in pos.connectedOrders:
                         if order.limit_price != longEntry or order.amount != longAmount:
                             order.limit_price= longEntry
@@ -132,8 +138,6 @@ class MeanReversion(StrategyWithExitModulesAndFilter):
                 gotShort= True
                 if pos.status == PositionStatus.PENDING:
                     pos.amount= shortAmount
-                    pos.initialStop= shortStop
-                    pos.wantedEntry= shortEntry
                     for order in pos.connectedOrders:
                         if order.limit_price != shortEntry or order.amount != shortAmount:
                             order.limit_price= shortEntry
@@ -35,6 +35,9 @@ class SfpStrategy(ChannelStrategy):
     def myId(self):
         return "sfp"
 
+    def needs_intrabar_ticks(self) -> bool:
+        return False  # only opens orders on a new bar
+
     def init(self, bars: List[Bar], account: Account, symbol: Symbol):
         self.logger.info("init with %.1f %i %i | %.1f %.2f  %.2f | %i %i %i %.1f | %i %i | %.1f %s" %
                          (self.tp_fac,self.init_stop_type, self.stop_buffer_fac,
@@ -55,7 +58,10 @@ class SfpStrategy(ChannelStrategy):
             self.logger.info(" no entries allowed")
             return
 
-        atr = clean_range(bars, offset=0, length=self.channel.max_look_back * 2)
+        # the channel already calculated it for the current bar
+        current_data: Data = self.channel.get_data(bars[0])
+        atr = current_data.atr if current_data is not None else \
+            clean_range(bars, offset=0, length=self.channel.max_look_back * 2)
 
         # test for SFP:
         # High > HH der letzten X
@@ -32,6 +32,11 @@ class ChannelStrategy(StrategyWithExitModulesAndFilter):
         self.trail_back = trail_back
         return self
 
+    def register_indicators(self, registry):
+        super().register_indicators(registry)
+        if self.channel is not None:
+            self.channel = registry.get(self.channel)
+
     def init(self, bars: List[Bar], account: Account, symbol: Symbol):
         super().init(bars, account, symbol)
         if self.channel is None:
@@ -42,7 +47,8 @@ class ChannelStrategy(StrategyWithExitModulesAndFilter):
                               self.channel.max_dist_factor, self.channel.max_swing_length,
                               self.risk_factor, self.max_risk_mul, self.risk_type, self.atr_factor_risk,
                               self.trail_active, self.delayed_swing_trail, self.trail_to_swing, self.trail_back))
-            self.channel.on_tick(bars)
+            if self.indicator_registry is None:
+                self.channel.on_tick(bars)
 
     def min_bars_needed(self) -> int:
         return self.channel.max_look_back + 1
@@ -59,7 +65,7 @@ class ChannelStrategy(StrategyWithExitModulesAndFilter):
         stop= stopLong if amount > 0 else stopShort
 
     def prep_bars(self, is_new_bar: bool, bars: list):
-        if is_new_bar:
+        if is_new_bar and self.indicator_registry is None:
             self.channel.on_tick(bars)
 
     def manage_open_order(self, order, position, bars, to_update, to_cancel, open_positions):
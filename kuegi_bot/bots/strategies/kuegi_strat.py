@@ -28,6 +28,9 @@ class KuegiStrategy(ChannelStrategy):
     def myId(self):
         return "kuegi"
 
+    def needs_intrabar_ticks(self) -> bool:
+        return False  # only opens orders on a new bar
+
     def init(self, bars: List[Bar], account: Account, symbol: Symbol):
         self.logger.info("init with %.0f %.1f  %.1f %i %s %s %s  %s" %
                          (self.max_channel_size_factor, self.min_channel_size_factor, self.entry_tightening,
@@ -142,7 +145,10 @@ class KuegiStrategy(ChannelStrategy):
                 (not self.delayed_entry or (last_data.shortSwing is not None and last_data.longSwing is not None)):
             swing_range = data.longSwing - data.shortSwing
 
-            atr = clean_range(bars, offset=0, length=self.channel.max_look_back * 2)
+            # the channel already calculated it for the current bar
+            current_data: Data = self.channel.get_data(bars[0])
+            atr = current_data.atr if current_data is not None else \
+                clean_range(bars, offset=0, length=self.channel.max_look_back * 2)
             if atr * self.min_channel_size_factor < swing_range < atr * self.max_channel_size_factor:
                 risk = self.risk_factor
                 longEntry = self.symbol.normalizePrice(max(data.longSwing, bars[0].high), roundUp=True)
@@ -52,6 +52,26 @@ class TradingBot:
     def min_bars_needed(self):
         return 5
 
+    def needs_intrabar_ticks(self, account: Account) -> bool:
+        ''' False if the bot would do nothing on the ticks until the next bar (no orders, positions, or anything
+        else to manage intrabar). the backtest then skips the rest of the bar '''
+        return True
+
+    def use_indicator_cache(self, cache, bars: List[Bar]):
+        ''' called before init with the full history, bots with cacheable indicators load them from the cache '''
+        pass
+
+    def save_indicator_cache(self, bars: List[Bar]):
+        pass
+
+    def register_indicators(self, registry):
+        ''' adds the indicators of the bot to the registry '''
+        pass
+
+    def limit_indicator_rows(self, max_rows: int):
+        ''' called by engines that only keep the last max_rows bars, so indicators don't keep data of older ones '''
+        pass
+
     def reset(self):
         self.last_time = 0
         self.open_positions = {}
@@ -278,6 +278,14 @@ class ExchangeWithWS(ExchangeInterface):
         """ bars need to be ordered newest bar = index 0 """
         return process_low_tf_bars(bars, timeframe_minutes, start_offset_minutes)
 
+    def update_bars(self, builder) -> bool:
+        # only the entries of the buffer that changed since the last tick
+        return builder.sync(self.bars, self._to_subbar)
+
+    def _to_subbar(self, entry) -> Bar:
+        """ converts an entry of self.bars into a Bar """
+        return entry
+
     def get_position(self, symbol=None):
         if symbol is None:
             symbol = self.symbol
@@ -113,6 +113,10 @@ class BitmexInterface(ExchangeInterface):
     def recent_bars(self,timeframe_minutes,start_offset_minutes)->List[Bar]:
         return process_low_tf_bars(self.h1Bars, timeframe_minutes, start_offset_minutes=start_offset_minutes)
 
+    def update_bars(self, builder) -> bool:
+        # trades change h1Bars[0] in place, the builder always takes the newest one
+        return builder.sync(self.h1Bars)
+
     def get_instrument(self, symbol=None):
         if symbol is None:
             symbol = self.symbol
@@ -206,6 +206,9 @@ class ByBitLinearInterface(ExchangeWithWS):
 
         return self._aggregate_bars(reversed(apibars), timeframe_minutes, start_offset_minutes)
 
+    def _to_subbar(self, entry) -> Bar:
+        return self.barDictToBar(entry) if entry['open'] is not None else None
+
     def _aggregate_bars(self, apibars, timeframe_minutes, start_offset_minutes) -> List[Bar]:
         subbars = []
         for b in apibars:
@@ -1,7 +1,10 @@
 import math
 from typing import List
 
+import numpy as np
+
 from kuegi_bot.indicators.indicator import Indicator, get_bar_value, highest, lowest, BarSeries, clean_range
+from kuegi_bot.indicators.rolling import WindowWMA, window_sums
 from kuegi_bot.trade_engine import Bar
 from kuegi_bot.utils import log
 
@@ -9,18 +12,30 @@ logger = log.setup_custom_logger()
 
 
 class Data:
-    def __init__(self,  hma, hmasum, inner, inner1, inner2):
-        self.inner = inner
-        self.inner1= inner1
-        self.inner2= inner2
-        self.hmasum= hmasum
+    def __init__(self, hma, inner, sum=None, weighted=None, halfsum=None, halfweighted=None,
+                 hmasum=None, hmaweighted=None):
         self.hma = hma
+        self.inner = inner
+        # state of the windows (see WindowWMA), so the next bar only needs one step
+        self.sum = sum
+        self.weighted = weighted
+        self.halfsum = halfsum
+        self.halfweighted = halfweighted
+        self.hmasum = hmasum
+        self.hmaweighted = hmaweighted
 
 
 class HMA(Indicator):
     ''' Hull Moving Average
         HMA[i] = MA( (2*MA(input, period/2) – MA(input, period)), SQRT(period))
+        maType 0 uses simple moving averages, maType 1 weighted ones (the original definition)
     '''
+    data_fields = [("hma", float), ("inner", float), ("sum", float), ("weighted", float), ("halfsum", float),
+                   ("halfweighted", float), ("hmasum", float), ("hmaweighted", float)]
+    data_class = Data
+
+    # from this number of changed bars on, they get calculated in one batch
+    batch_min_bars = 50
 
     def __init__(self, period: int = 15, maType: int= 0):
         super().__init__(
@@ -38,70 +53,74 @@ class HMA(Indicator):
             else:
                 break
 
+        if first_changed + 1 >= self.batch_min_bars:
+            self.storage.write_columns([bars[idx].tstamp for idx in range(first_changed, -1, -1)],
+                                       [column[-(first_changed + 1):] for column in self.calc_batch(bars)])
+            return
         for idx in range(first_changed, -1, -1):
             self.process_bar(bars[idx:])
 
+    def ma_value(self, wma: WindowWMA):
+        return wma.mean if self.maType == 0 else wma.value
+
+    def inner_value(self, bar: Bar):
+        data = self.get_data(bar)
+        return data.inner if data is not None else bar.close
+
     def process_bar(self, bars: List[Bar]):
         if len(bars) < self.period:
-            self.write_data(bars[0], Data(hma=bars[0].close, hmasum=None,
-                                          inner=bars[0].close, inner1=None,inner2=None))
+            self.write_data(bars[0], Data(hma=bars[0].close, inner=bars[0].close))
             return
 
-        prevData= self.get_data(bars[1])
-        inner1 = 0
-        inner2 = 0
-        inner= 0
+        prevData = self.get_data(bars[1])
+        close = bars[0].close
+        if prevData is not None and prevData.sum is not None:
+            full = WindowWMA(self.period, prevData.sum, prevData.weighted).step(close, bars[self.period].close)
+            half = WindowWMA(self.halfperiod, prevData.halfsum, prevData.halfweighted)\
+                .step(close, bars[self.halfperiod].close)
+        else:
+            full = WindowWMA.of([bar.close for bar in reversed(bars[:self.period])], self.period)
+            half = WindowWMA.of([bar.close for bar in reversed(bars[:self.halfperiod])], self.halfperiod)
+        inner = 2 * self.ma_value(half) - self.ma_value(full)
+
+        if prevData is not None and prevData.hmasum is not None and len(bars) > self.hmalength:
+            hma = WindowWMA(self.hmalength, prevData.hmasum, prevData.hmaweighted)\
+                .step(inner, self.inner_value(bars[self.hmalength]))
+        else:
+            hma = WindowWMA.of([self.inner_value(bar) for bar in reversed(bars[1:self.hmalength])] + [inner],
+                               self.hmalength)
+
+        self.write_data(bars[0], Data(hma=self.ma_value(hma), inner=inner,
+                                      sum=full.sum, weighted=full.weighted,
+                                      halfsum=half.sum, halfweighted=half.weighted,
+                                      hmasum=hma.sum, hmaweighted=hma.weighted))
+
+    def calc_batch(self, bars: List[Bar]) -> list:
+        ''' the columns of all bars in one go, oldest first '''
+        closes = np.array([bar.close for bar in reversed(bars)], dtype=np.float64)
+        count = len(closes)
+        columns = [closes.copy(), closes.copy()] + [np.full(count, np.nan) for i in range(6)]
+        first = self.period - 1  # first bar with a full window
+        if count <= first:
+            return columns
+        full_sums, full_weighted = window_sums(closes, self.period)
+        half_sums, half_weighted = window_sums(closes[first - self.halfperiod + 1:], self.halfperiod)
         if self.maType == 0:
-            if prevData is not None and prevData.inner1 is not None:
-                inner1= prevData.inner1
-                inner2= prevData.inner2
-                inner1 += bars[0].close - bars[self.period].close
-                inner2 += bars[0].close - bars[self.halfperiod].close
-            else:
-                for idx, sub in enumerate(bars[:self.period]):
-                    inner1 += sub.close
-                    if idx < self.halfperiod:
-                        inner2 += sub.close
-
-            inner = (2 * inner2 / self.halfperiod) - inner1 / self.period
-        elif self.maType == 1:
-            for idx, sub in enumerate(bars[:self.period]):
-                inner1 += sub.close*(self.period-idx)/self.period
-                if idx < self.halfperiod:
-                    inner2 += sub.close*(self.halfperiod-idx)/self.halfperiod
-
-            inner = (2 * inner2*2/(self.halfperiod+1)) - inner1*2/(self.period+1)
-
-
-        hmasum= 0
-        hma = 0
+            inner = 2 * half_sums / self.halfperiod - full_sums / self.period
+        else:
+            inner = (2 * half_weighted * 2 / (self.halfperiod * (self.halfperiod + 1))
+                     - full_weighted * 2 / (self.period * (self.period + 1)))
+        inners = columns[1]
+        inners[first:] = inner
+        hma_sums, hma_weighted = window_sums(inners[first - self.hmalength + 1:], self.hmalength)
         if self.maType == 0:
-            cnt=1
-            firstInner = self.get_data(bars[self.hmalength])
-            if firstInner is not None and firstInner.inner is not None and prevData.hmasum is not None:
-                hmasum = prevData.hmasum
-                hmasum += inner - firstInner.inner
-                cnt = self.hmalength
-            else:
-                hmasum = inner
-                cnt = 1
-                for sub in bars[1:self.hmalength]:
-                    if self.get_data(sub) is not None:
-                        hmasum += self.get_data(sub).inner
-                        cnt += 1
-            hma= hmasum/cnt
-        elif self.maType == 1:
-            hmasum = inner #*(self.hmalength)/(self.hmalength)
-            for idx, sub in enumerate(bars[1:self.hmalength]):
-                if self.get_data(sub) is not None:
-                    hmasum += self.get_data(sub).inner*(self.hmalength-(idx+1))/(self.hmalength)
-                else:
-                    hmasum += sub.close*(self.hmalength-(idx+1))/(self.hmalength)
-
-            hma= hmasum*2/(self.hmalength+1)
-
-        self.write_data(bars[0], Data(hma=hma, hmasum=hmasum,
-                                      inner=inner, inner1=inner1, inner2=inner2))
+            columns[0][first:] = hma_sums / self.hmalength
+        else:
+            columns[0][first:] = hma_weighted * 2 / (self.hmalength * (self.hmalength + 1))
+        for column, values in zip(columns[2:], (full_sums, full_weighted, half_sums, half_weighted,
+                                                hma_sums, hma_weighted)):
+            column[first:] = values
+        return columns
 
     def get_line_names(self):
         return ["hma" + str(self.period)]
@@ -1,7 +1,7 @@
-import math
 from typing import List
 
 from kuegi_bot.indicators.indicator import Indicator, get_bar_value, highest, lowest, BarSeries, clean_range
+from kuegi_bot.indicators.rolling import WindowStats
 from kuegi_bot.trade_engine import Bar
 from kuegi_bot.utils import log
 
@@ -9,15 +9,19 @@ logger = log.setup_custom_logger()
 
 
 class Data:
-    def __init__(self,  mean, std, sum):
+    def __init__(self,  mean, std, sum, compensation=0.0, m2=None):
         self.mean = mean
         self.std= std
         self.sum= sum
+        self.compensation = compensation
+        self.m2 = m2
 
 
 class MeanStd(Indicator):
     ''' Mean and Standard deviation
     '''
+    data_fields = [("mean", float), ("std", float), ("sum", float), ("compensation", float), ("m2", float)]
+    data_class = Data
 
     def __init__(self, period: int):
         super().__init__("MeanStd" + str(period))
@@ -34,19 +38,14 @@ class MeanStd(Indicator):
         for idx in range(first_changed, -1, -1):
             bar= bars[idx]
             if idx < len(bars) - self.period:
-                data = self.get_data(bar)
-                sum = 0
-                sqsum= 0
-                if data is not None:
-                    sum = data.sum + bar.close - bars[idx+self.period].close
+                last = self.get_data(bars[idx + 1]) if idx < len(bars) - self.period - 1 else None
+                if last is not None and last.m2 is not None:
+                    stats = WindowStats(self.period, last.sum, last.compensation, last.m2)\
+                        .step(bar.close, bars[idx + self.period].close)
                 else:
-                    for sub in bars[idx:idx + self.period]:
-                        sum += sub.close
-                mean = sum/self.period
-
-                for sub in bars[idx:idx + self.period]:
-                    sqsum += (sub.close-mean)*(sub.close-mean)/self.period
-                self.write_data(bar, Data(mean=mean,std= math.sqrt(sqsum),sum=sum))
+                    stats = WindowStats.of([sub.close for sub in bars[idx:idx + self.period]], self.period)
+                self.write_data(bar, Data(mean=stats.mean, std=stats.std, sum=stats.sum,
+                                          compensation=stats.compensation, m2=stats.m2))
             else:
                 self.write_data(bar, None)
 
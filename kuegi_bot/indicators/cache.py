@@ -0,0 +1,91 @@
+import hashlib
+import os
+import re
+from typing import List
+
+import numpy as np
+
+from kuegi_bot.indicators.indicator import Indicator
+from kuegi_bot.utils.trading_classes import Bar
+
+
+def bar_hashes(bars: list) -> np.ndarray:
+    ''' 64 bit hash of tstamp, ohlc and volume of every bar '''
+    values = np.array([(bar.tstamp, bar.open, bar.high, bar.low, bar.close, bar.volume) for bar in bars],
+                      dtype=np.float64).reshape(-1, 6)
+    return np.fromiter((int.from_bytes(hashlib.md5(row.tobytes()).digest()[:8], "little", signed=True)
+                        for row in values), dtype=np.int64, count=len(values))
+
+
+class IndicatorCache:
+    ''' keeps the data of indicators on disk, so a restart or another backtest on the same bars doesn't need to
+    calculate them again.
+    one file per (indicator id, source, timeframe, offset), it contains the data of the closed bars up to the last
+    tstamp of the bars it got saved with, together with a hash of every input bar. on load only the rows whose
+    bars are unchanged are used (from the oldest bar on, up to the first difference). everything after it has to be
+    calculated by the indicator as usual.
+    a read_only cache never gets written, f.e. if multiple runs on parts of the bars use data calculated on all of them.
+    '''
+
+    def __init__(self, directory: str, source: str, timeframe: int, offset: int = 0, read_only: bool = False):
+        self.directory = directory
+        self.source = source
+        self.timeframe = timeframe
+        self.offset = offset
+        self.read_only = read_only
+        # hashes of the last bars, a backtest uses the same bars for all indicators
+        self._hashed_bars = None
+        self._hashes = None
+
+    def file_name(self, indicator: Indicator):
+        indicator_id = re.sub(r"[^\w.,()-]", "_", indicator.id)
+        return os.path.join(self.directory,
+                            "%s_%s_%d_%d.npz" % (indicator_id, self.source, self.timeframe, self.offset))
+
+    def _closed_bars(self, bars: List[Bar]):
+        ''' tstamps and hashes of the closed bars (all but bars[0]), oldest first '''
+        closed = [bars[idx] for idx in range(len(bars) - 1, 0, -1)]
+        key = (len(closed), closed[-1].tstamp if closed else None, closed[0].tstamp if closed else None)
+        if self._hashed_bars != key:
+            self._hashes = bar_hashes(closed)
+            self._hashed_bars = key
+        return np.array([bar.tstamp for bar in closed], dtype=np.int64), self._hashes
+
+    def load(self, indicator: Indicator, bars: List[Bar]):
+        ''' writes the cached data of the unchanged bars into the storage of the indicator.
+        returns the tstamp of the last bar it got data for, None if nothing could be used '''
+        file_name = self.file_name(indicator)
+        if indicator.storage is None or not os.path.exists(file_name):
+            return None
+        with np.load(file_name) as cached:
+            if list(cached["names"]) != indicator.storage.names:
+                return None
+            cached_tstamps = cached["tstamps"]
+            cached_hashes = cached["hashes"]
+            cached_valid = cached["valid"]
+            cached_columns = [cached["column%d" % idx] for idx in range(len(indicator.storage.names))]
+        tstamps, hashes = self._closed_bars(bars)
+        if len(cached_tstamps) == 0 or len(tstamps) == 0:
+            return None
+        positions = np.minimum(np.searchsorted(cached_tstamps, tstamps), len(cached_tstamps) - 1)
+        matching = (cached_tstamps[positions] == tstamps) & (cached_hashes[positions] == hashes)
+        count = len(matching) if matching.all() else int(np.argmin(matching))
+        if count == 0:
+            return None
+        rows = positions[:count]
+        indicator.storage.write_columns(tstamps[:count], [column[rows] for column in cached_columns],
+                                        cached_valid[rows])
+        return int(tstamps[count - 1])
+
+    def save(self, indicator: Indicator, bars: List[Bar]):
+        ''' saves the data of the closed bars (all but bars[0]) '''
+        if indicator.storage is None or self.read_only:
+            return
+        tstamps, hashes = self._closed_bars(bars)
+        valid, columns = indicator.storage.read_columns(tstamps)
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = self.file_name(indicator)
+        with open(file_name + ".tmp", "wb") as file:
+            np.savez(file, names=np.array(indicator.storage.names), tstamps=tstamps, hashes=hashes, valid=valid,
+                     **{"column%d" % idx: column for idx, column in enumerate(columns)})
+        os.replace(file_name + ".tmp", file_name)
@@ -5,6 +5,8 @@ from typing import List
 from enum import Enum
 
 from kuegi_bot.utils.trading_classes import Bar
+from kuegi_bot.indicators.storage import IndicatorStorage
+from kuegi_bot.indicators.rolling import WindowStats
 
 
 class BarSeries(Enum):
@@ -23,31 +25,48 @@ def get_bar_value(bar: Bar, series: BarSeries):
 
 
 def highest(bars: List[Bar], length: int, offset: int, series: BarSeries):
-    result: float = get_bar_value(bars[offset], series)
-    for idx in range(offset, offset + length):
-        if result < get_bar_value(bars[idx], series):
-            result = get_bar_value(bars[idx], series)
-    return result
+    attr = series.value
+    if length <= 1:
+        return getattr(bars[offset], attr)
+    return max(getattr(bars[idx], attr) for idx in range(offset, offset + length))
 
 
 def lowest(bars: List[Bar], length: int, offset: int, series: BarSeries):
-    result: float = get_bar_value(bars[offset], series)
-    for idx in range(offset, offset + length):
-        if result > get_bar_value(bars[idx], series):
-            result = get_bar_value(bars[idx], series)
-    return result
+    attr = series.value
+    if length <= 1:
+        return getattr(bars[offset], attr)
+    return min(getattr(bars[idx], attr) for idx in range(offset, offset + length))
 
 
 class Indicator:
+    # fields (name, float or int) of the data per bar. if set, the data is kept in typed columns of an
+    # IndicatorStorage instead of the bot_data of each bar. get_data creates data_class(**fields) from them,
+    # or returns the value directly if there is no data_class.
+    data_fields = None
+    data_class = None
+
     def __init__(self, indiId: str):
         self.id = indiId
-        pass
+        self.storage = IndicatorStorage(self.data_fields, self.data_class) if self.data_fields is not None else None
 
     def on_tick(self, bars: List[Bar]):
         pass
 
+    def clear(self):
+        ''' drops the calculated data (only for data in the storage) '''
+        if self.storage is not None:
+            self.storage.clear()
+
+    def limit_rows(self, max_rows: int):
+        ''' keeps the data of at most max_rows bars, the oldest get overwritten '''
+        if self.storage is not None:
+            self.storage.limit(max_rows)
+
     def write_data(self, bar: Bar, data):
-        self.write_data_static(bar, data, self.id)
+        if self.storage is not None:
+            self.storage.write(bar.tstamp, data)
+        else:
+            self.write_data_static(bar, data, self.id)
 
     @staticmethod
     def write_data_static(bar: Bar, data, indiId: str):
@@ -57,6 +76,8 @@ class Indicator:
         bar.bot_data["indicators"][indiId] = data
 
     def get_data(self,bar:Bar):
+        if self.storage is not None:
+            return self.storage.get_data(bar.tstamp)
         return self.get_data_static(bar, self.id)
 
     @staticmethod
@@ -83,6 +104,9 @@ class Indicator:
 
 
 class SMA(Indicator):
+    # sum and compensation are the running sum of the window, so the next bar only needs one step
+    data_fields = [("value", float), ("sum", float), ("compensation", float)]
+
     def __init__(self, period: int):
         super().__init__("SMA" + str(period))
         self.period = period
@@ -98,14 +122,12 @@ class SMA(Indicator):
         for idx in range(first_changed, -1, -1):
             bar= bars[idx]
             if idx < len(bars) - self.period:
-                sum = 0
-                cnt = 0
-                for sub in bars[idx:idx + self.period]:
-                    sum += sub.close
-                    cnt += 1
-
-                sum /= cnt
-                self.write_data(bar, sum)
+                last = self.storage.get_values(bars[idx + 1].tstamp) if idx < len(bars) - self.period - 1 else None
+                if last is not None and last[0] is not None:
+                    stats = WindowStats(self.period, last[1], last[2]).step(bar.close, bars[idx + self.period].close)
+                else:
+                    stats = WindowStats.of([sub.close for sub in bars[idx:idx + self.period]], self.period)
+                self.storage.write_values(bar.tstamp, (stats.mean, stats.sum, stats.compensation))
             else:
                 self.write_data(bar, None)
 
@@ -114,6 +136,8 @@ class SMA(Indicator):
 
 
 class EMA(Indicator):
+    data_fields = [("value", float)]
+
     def __init__(self, period: int):
         super().__init__("EMA" + str(period))
         self.period = period
@@ -140,17 +164,18 @@ class EMA(Indicator):
 
 
 from functools import reduce
+from operator import add
 
 
 def clean_range(bars: List[Bar], offset: int, length: int):
     ranges = []
-    for idx in range(offset, offset + length):
-        if idx < len(bars):
-            ranges.append(bars[idx].high - bars[idx].low)
+    for idx in range(offset, min(offset + length, len(bars))):
+        bar = bars[idx]
+        ranges.append(bar.high - bar.low)
 
     ranges.sort(reverse=True)
 
     # ignore the biggest 10% of ranges
     ignored_count = int(length / 5)
-    sum = reduce(lambda x1, x2: x1 + x2, ranges[ignored_count:])
+    sum = reduce(add, ranges[ignored_count:])
     return sum / (len(ranges) - ignored_count)
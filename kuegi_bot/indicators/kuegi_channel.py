@@ -1,6 +1,11 @@
+from functools import reduce
+from operator import add
 from typing import List
 
+import numpy as np
+
 from kuegi_bot.indicators.indicator import Indicator, get_bar_value, highest, lowest, BarSeries, clean_range
+from kuegi_bot.indicators.rolling import RollingExtremum, RollingTrimmedMean
 from kuegi_bot.trade_engine import Bar
 from kuegi_bot.utils import log
 
@@ -18,6 +23,30 @@ class Data:
         self.atr = atr
 
 
+class BatchData:
+    ''' channel values of a series of bars as columns, oldest bar first. position 0 is bars[start_idx].
+    swings are nan where there is none '''
+
+    def __init__(self, start_idx: int, count: int):
+        self.start_idx = start_idx
+        self.sinceLongReset = np.zeros(count, dtype=np.int32)
+        self.sinceShortReset = np.zeros(count, dtype=np.int32)
+        self.longTrail = np.zeros(count)
+        self.shortTrail = np.zeros(count)
+        self.longSwing = np.full(count, np.nan)
+        self.shortSwing = np.full(count, np.nan)
+        self.buffer = np.zeros(count)
+        self.atr = np.zeros(count)
+
+    def __len__(self):
+        return len(self.atr)
+
+    def columns(self) -> list:
+        ''' the columns in the order of KuegiChannel.data_fields '''
+        return [self.sinceLongReset, self.sinceShortReset, self.longTrail, self.shortTrail,
+                self.longSwing, self.shortSwing, self.buffer, self.atr]
+
+
 class KuegiChannel(Indicator):
     ''' calculates trails and swings
     if the price makes a strong move the trail goes to the start of the move.
@@ -28,22 +57,155 @@ class KuegiChannel(Indicator):
     a strong move resets the swings. the bar of the move is never considered a swing point
 
     '''
+    data_fields = [("sinceLongReset", int), ("sinceShortReset", int), ("longTrail", float), ("shortTrail", float),
+                   ("longSwing", float), ("shortSwing", float), ("buffer", float), ("atr", float)]
+    data_class = Data
+
     def __init__(self, max_look_back: int = 15, threshold_factor: float = 0.9, buffer_factor: float = 0.05,
                  max_dist_factor: float = 2, max_swing_length: int = 3):
         super().__init__(
             'KuegiChannel(' + str(max_look_back) + ',' + str(threshold_factor) + ',' + str(buffer_factor) + ',' + str(
-                max_dist_factor) + ')')
+                max_dist_factor) + ',' + str(max_swing_length) + ')')
         self.max_look_back = max_look_back
         self.threshold_factor = threshold_factor
         self.buffer_factor = buffer_factor
         self.max_dist_factor = max_dist_factor
         self.max_swing_length = max_swing_length
+        # highs, lows and ranges of the closed bars before the processed one, for the trail and the atr
+        self.highs = RollingExtremum(max_look_back, is_max=True)
+        self.lows = RollingExtremum(max_look_back, is_max=False)
+        self.ranges = RollingTrimmedMean(max_look_back * 2)
+        self.last_pushed = None
+
+    # from this number of changed bars on, they get calculated in one batch
+    batch_min_bars = 50
 
     def on_tick(self, bars: List[Bar]):
         # ignore first 5 bars
-        for idx in range(len(bars) - self.max_look_back, -1, -1):
-            if bars[idx].did_change:
-                self.process_bar(bars[idx:])
+        last_idx = len(bars) - self.max_look_back
+        first_changed = -1
+        while first_changed < last_idx and bars[first_changed + 1].did_change:
+            first_changed += 1
+        if first_changed + 1 >= self.batch_min_bars:
+            batch = self.calc_batch(bars, first_changed)
+            self.storage.write_columns([bars[idx].tstamp for idx in range(batch.start_idx, -1, -1)],
+                                       batch.columns())
+            return
+        for idx in range(first_changed, -1, -1):
+            self.process_bar(bars[idx:])
+
+    def calc_batch(self, bars: List[Bar], start_idx: int = None) -> BatchData:
+        ''' calculates the channel for bars[start_idx] (default: the oldest possible) up to bars[0] in one pass.
+        same results as calling process_bar for each of them, but works on plain arrays instead of the bars.
+        the data of bars[start_idx + 1] is used as start, like process_bar would. nothing gets written to the bars.
+        '''
+        last_idx = len(bars) - self.max_look_back
+        if start_idx is None or start_idx > last_idx:
+            start_idx = last_idx
+        result = BatchData(start_idx, max(0, start_idx + 1))
+        if start_idx < 0:
+            return result
+        count = len(bars)
+        highs = [bar.high for bar in reversed(bars)]
+        lows = [bar.low for bar in reversed(bars)]
+        first = count - 1 - start_idx
+        atrs = self.batch_atr(np.array(highs) - np.array(lows), first)
+
+        last_data: Data = self.get_data(bars[start_idx + 1]) if start_idx + 1 < count else None
+        if last_data is not None:
+            last = [last_data.sinceLongReset, last_data.sinceShortReset, last_data.buffer,
+                    last_data.longSwing, last_data.shortSwing]
+        else:
+            last = [0, 0, 0, None, None]
+        for pos in range(first, count):
+            [last_since_long, last_since_short, last_buffer, last_long_swing, last_short_swing] = last
+            atr = atrs[pos - first]
+            move_length = 1
+            if (highs[pos - 1] - lows[pos - 1]) < (highs[pos - 2] - lows[pos - 2]):
+                move_length = 2
+            threshold = atr * self.threshold_factor
+            maxDist = atr * self.max_dist_factor
+            buffer = atr * self.buffer_factor
+
+            # long trail
+            move_range = max(highs[pos - 1 - move_length], highs[pos - 2 - move_length])
+            if highs[pos - 1] - move_range > threshold and last_since_long >= move_length \
+                    and lows[pos - 1] < lows[pos] and move_range < lows[pos]:
+                sinceLongReset = move_length + 1
+            else:
+                sinceLongReset = min(last_since_long + 1, self.max_look_back)
+            longTrail = max(min(lows[pos - max(1, sinceLongReset - 1) + 1:pos + 1]) - maxDist,
+                            min(lows[pos - max(1, sinceLongReset) + 1:pos + 1]) - last_buffer)
+
+            # short trail
+            move_range = min(lows[pos - 1 - move_length], lows[pos - 2 - move_length])
+            if move_range - lows[pos - 1] > threshold and last_since_short >= move_length \
+                    and highs[pos - 1] > highs[pos] and move_range > highs[pos]:
+                sinceShortReset = move_length + 1
+            else:
+                sinceShortReset = min(last_since_short + 1, self.max_look_back)
+            shortTrail = min(max(highs[pos - max(1, sinceShortReset - 1) + 1:pos + 1]) + maxDist,
+                             max(highs[pos - max(1, sinceShortReset) + 1:pos + 1]) + last_buffer)
+
+            sinceReset = min(sinceLongReset, sinceShortReset)
+            if sinceReset >= 3:
+                longSwing = self.batch_swing(highs, pos, 1, last_long_swing, sinceReset, buffer)
+                shortSwing = self.batch_swing(lows, pos, -1, last_short_swing, sinceReset, buffer)
+                if last_long_swing is not None and last_long_swing < highs[pos]:
+                    longSwing = None
+                if last_short_swing is not None and last_short_swing > lows[pos]:
+                    shortSwing = None
+            else:
+                longSwing = None
+                shortSwing = None
+
+            idx = pos - first
+            result.sinceLongReset[idx] = sinceLongReset
+            result.sinceShortReset[idx] = sinceShortReset
+            result.longTrail[idx] = longTrail
+            result.shortTrail[idx] = shortTrail
+            if longSwing is not None:
+                result.longSwing[idx] = longSwing
+            if shortSwing is not None:
+                result.shortSwing[idx] = shortSwing
+            result.buffer[idx] = buffer
+            result.atr[idx] = atr
+            last = [sinceLongReset, sinceShortReset, buffer, longSwing, shortSwing]
+        return result
+
+    def batch_atr(self, ranges, first: int) -> list:
+        ''' clean_range(bars, 0, max_look_back * 2) for every position from first on. ranges oldest first '''
+        length = self.max_look_back * 2
+        ignored_count = int(length / 5)
+        result = []
+        # at the start there are less bars than length
+        for pos in range(first, min(length - 1, len(ranges))):
+            values = sorted(ranges[:pos + 1].tolist(), reverse=True)[ignored_count:]
+            result.append(reduce(add, values) / len(values))
+        start = max(first, length - 1)
+        if start < len(ranges):
+            windows = np.lib.stride_tricks.sliding_window_view(ranges, length)[start - length + 1:]
+            kept = -np.sort(-windows, axis=1)[:, ignored_count:]
+            # cumsum adds up sequentially in the same order as clean_range, np.sum would not
+            result.extend((np.cumsum(kept, axis=1)[:, -1] / kept.shape[1]).tolist())
+        return result
+
+    def batch_swing(self, series: list, pos: int, direction, default, maxLookBack, minDelta):
+        ''' calc_swing on a list of highs (direction > 0) or lows (oldest first) for the bar at pos '''
+        for length in range(1, min(self.max_swing_length + 1, maxLookBack - 1)):
+            window = series[pos - length:pos]
+            pre = series[pos - length - 2:pos - length]
+            if direction > 0:
+                e = max(window)
+                preRange = max(pre)
+            else:
+                e = min(window)
+                preRange = min(pre)
+            if direction * (e - preRange) > 0 \
+                    and direction * (e - series[pos - length - 1]) > minDelta \
+                    and direction * (e - series[pos]) > minDelta:
+                return e + direction * minDelta
+        return default
 
     def get_data_for_plot(self, bar: Bar):
         data: Data = self.get_data(bar)
@@ -67,8 +229,38 @@ class KuegiChannel(Indicator):
     def get_line_names(self):
         return ["longTrail", "shortTrail", "longSwing", "shortSwing"]
 
+    def sync_closed_bars(self, bars: List[Bar]):
+        ''' makes sure highs, lows and ranges end with bars[1]. only pushes bars[1] if we already got bars[2],
+        rebuilds if bars got changed or something else got processed in between '''
+        prev = bars[1]
+        closed_count = min(len(bars) - 1, self.ranges.length - 1)
+        if self.last_pushed == (prev.tstamp, prev.high, prev.low) and len(self.ranges) == closed_count:
+            return
+        before = bars[2] if len(bars) > 2 else None
+        if before is None or self.last_pushed != (before.tstamp, before.high, before.low) \
+                or len(self.ranges) != min(len(bars) - 2, self.ranges.length - 1):
+            self.highs.reset()
+            self.lows.reset()
+            self.ranges.reset()
+            for idx in range(closed_count, 1, -1):
+                self.push_closed_bar(bars[idx])
+        self.push_closed_bar(prev)
+
+    def push_closed_bar(self, bar: Bar):
+        self.highs.push(bar.high)
+        self.lows.push(bar.low)
+        self.ranges.push(bar.high - bar.low)
+        if len(self.ranges) == self.ranges.length:
+            # leave room for the processed bar, otherwise it would push out the oldest one
+            self.ranges.pop_oldest()
+        self.last_pushed = (bar.tstamp, bar.high, bar.low)
+
     def process_bar(self, bars: List[Bar]):
-        atr = clean_range(bars, offset=0, length=self.max_look_back * 2)
+        self.sync_closed_bars(bars)
+        # same as clean_range(bars, offset=0, length=self.max_look_back * 2)
+        self.ranges.push(bars[0].high - bars[0].low)
+        atr = self.ranges.value()
+        self.ranges.pop_last()
 
         offset = 1
         move_length = 1
@@ -149,13 +341,26 @@ class KuegiChannel(Indicator):
         else:
             sinceReset = min(last_since_reset + 1, self.max_look_back)
 
+        # same as lowest/highest(bars, length, 0, ...), but with the rolling values of the closed bars
         if direction > 0:
             trail = max(
-                lowest(bars, sinceReset - 1, 0, BarSeries.LOW) - maxDist,
-                lowest(bars, sinceReset, 0, BarSeries.LOW) - last_buffer)
+                self.trail_extremum(bars[0].low, self.lows, sinceReset - 1) - maxDist,
+                self.trail_extremum(bars[0].low, self.lows, sinceReset) - last_buffer)
         else:
             trail = min(
-                highest(bars, sinceReset - 1, 0, BarSeries.HIGH) + maxDist,
-                highest(bars, sinceReset, 0, BarSeries.HIGH) + last_buffer)
+                self.trail_extremum(bars[0].high, self.highs, sinceReset - 1) + maxDist,
+                self.trail_extremum(bars[0].high, self.highs, sinceReset) + last_buffer)
 
         return [sinceReset, trail]
+
+    @staticmethod
+    def trail_extremum(current, closed: RollingExtremum, length):
+        if length <= 1:
+            return current
+        other = closed.query(length - 1)
+        if other is None:
+            return current
+        if closed.is_max:
+            return max(current, other)
+        else:
+            return min(current, other)
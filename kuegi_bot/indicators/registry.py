@@ -0,0 +1,108 @@
+from typing import List
+
+from kuegi_bot.indicators.cache import IndicatorCache
+from kuegi_bot.indicators.indicator import Indicator
+from kuegi_bot.utils.trading_classes import Bar
+
+
+class IndicatorRegistry:
+    ''' the indicators of a bot, one instance per indicator id. strategies get their indicators from here (get),
+    so strategies with the same indicator share one instance and it gets calculated only once per tick.
+    on_tick calculates the indicators in dependency order: indicators used by another indicator (attributes that
+    are indicators) come before it.
+    with a cache (use_cache), the data of unchanged closed bars comes from disk and only the rest gets calculated.
+    '''
+
+    def __init__(self):
+        self.indicators = {}  # id -> indicator
+        self.ordered: List[Indicator] = []
+        self.cache: IndicatorCache = None
+        self.cached_until = {}  # id -> tstamp of the last bar with data from the cache
+        # id -> (tstamp, values) of the cached data of a bar that got calculated as current bar (f.e. replayed in a
+        # backtest). the current bar might not be complete, so the cached data gets back once the bar is closed.
+        self.overwritten = {}
+
+    def get(self, indicator: Indicator) -> Indicator:
+        ''' the registered indicator with the id of the given one. registers it (and its dependencies) if new '''
+        registered = self.indicators.get(indicator.id)
+        if registered is not None:
+            return registered
+        for name, dependency in list(vars(indicator).items()):
+            if isinstance(dependency, Indicator):
+                setattr(indicator, name, self.get(dependency))
+        self.indicators[indicator.id] = indicator
+        self.ordered.append(indicator)
+        return indicator
+
+    def use_cache(self, cache: IndicatorCache, bars: List[Bar]):
+        ''' loads the cached data of all registered indicators for the bars (the full history) '''
+        self.cache = cache
+        self.cached_until = {}
+        self.overwritten = {}
+        for indicator in self.ordered:
+            tstamp = cache.load(indicator, bars)
+            # data of an indicator is only valid as far as the data of its dependencies
+            for dependency in vars(indicator).values():
+                if tstamp is not None and isinstance(dependency, Indicator):
+                    dependency_tstamp = self.cached_until.get(dependency.id)
+                    tstamp = min(tstamp, dependency_tstamp) if dependency_tstamp is not None else None
+            if tstamp is not None:
+                self.cached_until[indicator.id] = tstamp
+
+    def clear(self):
+        ''' drops the data of all indicators, f.e. before a new run '''
+        for indicator in self.ordered:
+            indicator.clear()
+        self.cached_until = {}
+        self.overwritten = {}
+
+    def limit_rows(self, max_rows: int):
+        ''' the indicators keep the data of at most max_rows bars, for bots that only keep the recent bars '''
+        for indicator in self.ordered:
+            indicator.limit_rows(max_rows)
+
+    def save_cache(self, bars: List[Bar]):
+        ''' saves the indicators that got data beyond the cache '''
+        if self.cache is None or len(bars) < 2:
+            return
+        for indicator in self.ordered:
+            if self.cached_until.get(indicator.id) != bars[1].tstamp:
+                self.cache.save(indicator, bars)
+                self.cached_until[indicator.id] = bars[1].tstamp
+
+    def on_tick(self, bars: List[Bar]):
+        for indicator in self.ordered:
+            cached_until = self.cached_until.get(indicator.id)
+            if cached_until is None:
+                indicator.on_tick(bars)
+            else:
+                self._tick_with_cache(indicator, bars, cached_until)
+
+    def _tick_with_cache(self, indicator: Indicator, bars: List[Bar], cached_until: int):
+        ''' hides the changes of the bars that got their data from the cache from the indicator '''
+        storage = indicator.storage
+        overwritten = self.overwritten.pop(indicator.id, None)
+        if overwritten is not None:
+            tstamp, values = overwritten
+            if values is None:
+                storage.write(tstamp, None)
+            else:
+                storage.write_values(tstamp, values)
+        if bars[0].tstamp <= cached_until:
+            self.overwritten[indicator.id] = (bars[0].tstamp, storage.get_values(bars[0].tstamp))
+        hidden = []
+        for idx in range(1, len(bars)):  # the current bar always gets calculated
+            bar = bars[idx]
+            if not bar.did_change:
+                break
+            if bar.tstamp <= cached_until:
+                bar.did_change = False
+                hidden.append(bar)
+        try:
+            indicator.on_tick(bars)
+        finally:
+            for bar in hidden:
+                bar.did_change = True
+
+    def __len__(self):
+        return len(self.ordered)
@@ -0,0 +1,210 @@
+import math
+from bisect import bisect_left, insort
+from collections import deque
+from functools import reduce
+from operator import add
+
+import numpy as np
+
+
+class RollingExtremum:
+    ''' max (or min) of the last `length` values pushed, kept in a monotonic queue.
+    push is amortized O(1), query of the extremum over the last k <= length values is O(log length).
+    values are pushed oldest first.
+    the queue is a pair of lists with a moving head, so the bisect of query indexes them in O(1).
+    '''
+
+    def __init__(self, length: int, is_max: bool = True):
+        self.length = length
+        self.is_max = is_max
+        # positions (number of the push) and values of the candidates from _head on, values are strictly monotonic
+        self._positions = []
+        self._values = []
+        self._head = 0
+        self._count = 0
+
+    def reset(self):
+        self._positions = []
+        self._values = []
+        self._head = 0
+        self._count = 0
+
+    def push(self, value):
+        positions = self._positions
+        values = self._values
+        if self.is_max:
+            while len(values) > self._head and values[-1] <= value:
+                values.pop()
+                positions.pop()
+        else:
+            while len(values) > self._head and values[-1] >= value:
+                values.pop()
+                positions.pop()
+        positions.append(self._count)
+        values.append(value)
+        self._count += 1
+        if positions[self._head] <= self._count - 1 - self.length:
+            self._head += 1
+            if self._head > self.length:  # drop the outdated entries, amortized O(1) per push
+                del positions[:self._head]
+                del values[:self._head]
+                self._head = 0
+
+    def query(self, length: int = None):
+        ''' extremum of the last `length` values (default: all in the window). None if there are none '''
+        if length is None or length > self.length:
+            length = self.length
+        if length <= 0 or self._count == 0:
+            return None
+        idx = bisect_left(self._positions, self._count - length, self._head)
+        return self._values[idx] if idx < len(self._values) else None
+
+    def __len__(self):
+        return min(self._count, self.length)
+
+
+class RollingTrimmedMean:
+    ''' mean of the last `length` values without the biggest length/5 of them. same as clean_range, but the window
+    is kept sorted: a new value is placed with a binary search instead of sorting all values on every call.
+    the kept values are summed in the same (descending) order as in clean_range, so the result is bit-identical.
+    '''
+
+    def __init__(self, length: int):
+        self.length = length
+        self.ignored_count = int(length / 5)
+        self._window = deque()  # in push order
+        self._sorted = []  # same values, ascending
+        self._mean = None
+
+    def reset(self):
+        self._window.clear()
+        self._sorted = []
+        self._mean = None
+
+    def push(self, value):
+        self._window.append(value)
+        insort(self._sorted, value)
+        if len(self._window) > self.length:
+            self._remove_sorted(self._window.popleft())
+        self._mean = None
+
+    def pop_last(self):
+        ''' removes the last pushed value. values that got pushed out of the window by it don't come back '''
+        self._remove_sorted(self._window.pop())
+        self._mean = None
+
+    def pop_oldest(self):
+        self._remove_sorted(self._window.popleft())
+        self._mean = None
+
+    def _remove_sorted(self, value):
+        del self._sorted[bisect_left(self._sorted, value)]
+
+    def value(self):
+        if self._mean is None:
+            kept = len(self._sorted) - self.ignored_count
+            self._mean = reduce(add, reversed(self._sorted[:kept])) / kept
+        return self._mean
+
+    def __len__(self):
+        return len(self._window)
+
+
+class WindowStats:
+    ''' sum and variance of a window of `length` values. step() moves the window by one value in O(1):
+    the sum is Neumaier/Kahan compensated, the sum of squared deviations (m2) uses the windowed Welford update.
+    the state is only 3 numbers, so indicators can keep it per bar and continue from the previous bar.
+    '''
+
+    def __init__(self, length: int, sum: float = 0.0, compensation: float = 0.0, m2: float = 0.0):
+        self.length = length
+        self.sum = sum
+        self.compensation = compensation
+        self.m2 = m2
+
+    @staticmethod
+    def of(values, length: int):
+        ''' full calculation over the values of the window '''
+        stats = WindowStats(length)
+        for value in values:
+            stats._add(value)
+        mean = stats.mean
+        m2 = 0.0
+        for value in values:
+            m2 += (value - mean) * (value - mean)
+        stats.m2 = m2
+        return stats
+
+    def _add(self, value):
+        total = self.sum + value
+        if abs(self.sum) >= abs(value):
+            self.compensation += (self.sum - total) + value
+        else:
+            self.compensation += (value - total) + self.sum
+        self.sum = total
+
+    def step(self, added: float, removed: float):
+        ''' the stats of the window with added and without removed '''
+        result = WindowStats(self.length, self.sum, self.compensation, self.m2)
+        old_mean = self.mean
+        result._add(added)
+        result._add(-removed)
+        result.m2 = max(0.0, self.m2 + (added - removed) * (added - result.mean + removed - old_mean))
+        return result
+
+    @property
+    def mean(self) -> float:
+        return (self.sum + self.compensation) / self.length
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.length
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class WindowWMA:
+    ''' linear weighted moving average of a window of `length` values: the newest value has the weight length,
+    the oldest 1. keeps the plain and the weighted sum of the window, step() moves it by one value in O(1):
+    all weights drop by one (= minus the plain sum) and the new value comes in with the full weight.
+    like WindowStats, the state is small enough to be kept per bar.
+    '''
+
+    def __init__(self, length: int, sum: float = 0.0, weighted: float = 0.0):
+        self.length = length
+        self.sum = sum
+        self.weighted = weighted
+
+    @staticmethod
+    def of(values, length: int):
+        ''' full calculation, values oldest first '''
+        wma = WindowWMA(length)
+        for weight, value in enumerate(values, 1):
+            wma.sum += value
+            wma.weighted += weight * value
+        return wma
+
+    def step(self, added: float, removed: float):
+        ''' the window with added as newest and without removed (the oldest value) '''
+        return WindowWMA(self.length, self.sum + added - removed, self.weighted + self.length * added - self.sum)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.length
+
+    @property
+    def value(self) -> float:
+        return self.weighted * 2 / (self.length * (self.length + 1))
+
+
+def window_sums(values, length: int):
+    ''' batch version of WindowWMA: plain and weighted sums of every full window of the values (oldest first).
+    result[i] belongs to the window ending at values[i + length - 1]
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < length:
+        return np.empty(0), np.empty(0)
+    windows = np.lib.stride_tricks.sliding_window_view(values, length)
+    return windows.sum(axis=1), windows @ np.arange(1, length + 1, dtype=np.float64)
@@ -0,0 +1,160 @@
+import numpy as np
+
+
+class IndicatorStorage:
+    ''' keeps the data of one indicator in typed columns (one per field of the data), one row per bar.
+    the row of a bar is found via its tstamp, so the data stays with the bar even if the list of bars
+    gets shifted, sliced or the bar object gets replaced (f.e. the forming bar in the backtest).
+
+    the columns grow by doubling. if max_rows is set, they stop growing at that size and act as a ring buffer:
+    the oldest rows get overwritten.
+
+    fields are (name, type) with type float or int. float fields can be None (stored as nan).
+    if there is a data_class, get_data returns data_class(**fields), otherwise the value of the first field.
+    the other fields can then be used for internal state of the indicator, see write_values/get_values.
+    '''
+
+    def __init__(self, fields: list, data_class=None, max_rows: int = None, initial_rows: int = 256):
+        self.names = [name for name, kind in fields]
+        self.nullable = [kind is float for name, kind in fields]
+        self.data_class = data_class
+        self.max_rows = max_rows
+        size = initial_rows if max_rows is None else min(initial_rows, max_rows)
+        self.columns = [np.empty(size, dtype=np.float64 if kind is float else np.int64) for name, kind in fields]
+        self.tstamps = np.zeros(size, dtype=np.int64)
+        self.valid = np.zeros(size, dtype=bool)
+        self.rows = {}  # tstamp -> row
+        self.next_row = 0
+        self.wrapped = False
+        # data objects of the recently read rows, so repeated reads of the same bar don't create new ones
+        self.objects = {}
+
+    def clear(self):
+        self.rows = {}
+        self.objects = {}
+        self.valid[:] = False
+        self.next_row = 0
+        self.wrapped = False
+
+    def limit(self, max_rows: int):
+        ''' turns the storage into a ring buffer of max_rows (None = unlimited). drops all data '''
+        self.max_rows = max_rows
+        size = len(self.tstamps) if max_rows is None else min(len(self.tstamps), max_rows)
+        self.columns = [np.empty(size, dtype=column.dtype) for column in self.columns]
+        self.tstamps = np.zeros(size, dtype=np.int64)
+        self.valid = np.zeros(size, dtype=bool)
+        self.clear()
+
+    def _grow(self):
+        size = len(self.tstamps) * 2
+        if self.max_rows is not None:
+            size = min(size, self.max_rows)
+        self.columns = [np.resize(column, size) for column in self.columns]
+        self.tstamps = np.resize(self.tstamps, size)
+        valid = np.zeros(size, dtype=bool)
+        valid[:len(self.valid)] = self.valid
+        self.valid = valid
+
+    def _row_for(self, tstamp) -> int:
+        row = self.rows.get(tstamp)
+        if row is not None:
+            return row
+        if self.next_row == len(self.tstamps):
+            if self.max_rows is None or len(self.tstamps) < self.max_rows:
+                self._grow()
+            else:
+                self.next_row = 0
+                self.wrapped = True
+        row = self.next_row
+        self.next_row += 1
+        if self.wrapped:
+            # overwrite the oldest row
+            old = self.tstamps.item(row)
+            if self.rows.get(old) == row:
+                del self.rows[old]
+            self.objects.pop(row, None)
+        self.tstamps[row] = tstamp
+        self.valid[row] = False
+        self.rows[tstamp] = row
+        return row
+
+    def write(self, tstamp, data):
+        row = self._row_for(tstamp)
+        self.objects.pop(row, None)
+        if data is None:
+            self.valid[row] = False
+            return
+        if self.data_class is None:
+            values = (data,)
+        else:
+            values = [getattr(data, name) for name in self.names]
+        self._write_row(row, values)
+
+    def write_values(self, tstamp, values):
+        ''' writes the values of all fields (in the order of the fields) '''
+        row = self._row_for(tstamp)
+        self.objects.pop(row, None)
+        self._write_row(row, values)
+
+    def _write_row(self, row, values):
+        for column, value, nullable in zip(self.columns, values, self.nullable):
+            column[row] = np.nan if (nullable and value is None) else value
+        self.valid[row] = True
+
+    def write_columns(self, tstamps: list, columns: list, valid=None):
+        ''' writes many rows at once. columns in the order of the fields, same length as tstamps.
+        valid (optional) marks the rows without data '''
+        rows = np.fromiter((self._row_for(tstamp) for tstamp in tstamps), dtype=np.int64, count=len(tstamps))
+        for column, values in zip(self.columns, columns):
+            column[rows] = values
+        self.valid[rows] = True if valid is None else valid
+        self.objects = {}
+
+    def read_columns(self, tstamps: list):
+        ''' the rows of the tstamps as (valid, columns). rows without data are not valid '''
+        rows = np.fromiter((self.rows.get(tstamp, -1) for tstamp in tstamps), dtype=np.int64, count=len(tstamps))
+        found = rows >= 0
+        rows[~found] = 0
+        valid = found & self.valid[rows]
+        columns = []
+        for column, nullable in zip(self.columns, self.nullable):
+            values = column[rows]
+            values[~valid] = np.nan if nullable else 0
+            columns.append(values)
+        return valid, columns
+
+    def get_data(self, tstamp):
+        row = self.rows.get(tstamp)
+        if row is None:
+            return None
+        data = self.objects.get(row)
+        if data is not None:
+            return data
+        if not self.valid.item(row):
+            return None
+        if self.data_class is None:
+            value = self.columns[0].item(row)
+            return None if (self.nullable[0] and value != value) else value
+        values = {}
+        for name, column, nullable in zip(self.names, self.columns, self.nullable):
+            value = column.item(row)
+            values[name] = None if (nullable and value != value) else value
+        data = self.data_class(**values)
+        if len(self.objects) > 64:
+            self.objects = {}
+        self.objects[row] = data
+        return data
+
+    def get_values(self, tstamp):
+        ''' the values of all fields, None if there is no data for the tstamp '''
+        row = self.rows.get(tstamp)
+        if row is None or not self.valid.item(row):
+            return None
+        values = []
+        for column, nullable in zip(self.columns, self.nullable):
+            value = column.item(row)
+            values.append(None if (nullable and value != value) else value)
+        return values
+
+    def __len__(self):
+        return len(self.rows)
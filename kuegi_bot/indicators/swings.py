@@ -11,6 +11,8 @@ class Data:
 
 
 class Swings(Indicator):
+    data_fields = [("swingHigh", float), ("swingLow", float)]
+    data_class = Data
 
     def __init__(self, before: int = 2, after: int = 2):
         super().__init__("Swings(" + str(before) + "," + str(after) + ")")
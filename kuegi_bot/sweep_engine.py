@@ -0,0 +1,400 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from typing import Callable
+
+from kuegi_bot.backtest_engine import BackTest, SilentLogger
+from kuegi_bot.bots.trading_bot import TradingBot
+from kuegi_bot.indicators.cache import IndicatorCache
+from kuegi_bot.indicators.registry import IndicatorRegistry
+from kuegi_bot.utils.bar_store import BarStore, backing_store
+from kuegi_bot.utils.result_cache import ResultCache
+from kuegi_bot.utils.trading_classes import Symbol
+
+# the bars and settings of the current sweep. set once per worker process by _init_worker
+_bars = None
+_funding = None
+_symbol = None
+_market_slipage_percent = 0.15
+_result_cache = None
+_indicator_cache = None
+
+
+def _init_worker(bars, funding, symbol, market_slipage_percent, result_cache=None, indicator_cache=None):
+    global _bars, _funding, _symbol, _market_slipage_percent, _result_cache, _indicator_cache
+    if isinstance(bars, dict):  # spec of a shared BarStore
+        store = BarStore.attach(bars)
+        bars = store.to_bars() if bars.get("as_bars") else store
+    _bars = bars
+    _funding = funding
+    _symbol = symbol
+    _market_slipage_percent = market_slipage_percent
+    _result_cache = result_cache
+    _indicator_cache = indicator_cache
+
+
+def _run_combination(bot_factory: Callable[[list], TradingBot], params: list):
+    bot = bot_factory(params)
+    result = BackTest(bot, bars=_bars, funding=_funding, symbol=_symbol,
+                      market_slipage_percent=_market_slipage_percent, result_cache=_result_cache).run_cached()
+    return params, result.metrics
+
+
+def _run_window(bot_factory: Callable[[list], TradingBot], params: list, task, start: int, end: int,
+                with_equity: bool = False):
+    ''' runs the backtest on the bars from start to end (excl.), counted from the oldest bar.
+    the equity curve is relative to the initial equity '''
+    bot = bot_factory(params)
+    bars = _bars[len(_bars) - end:len(_bars) - start]
+    result = BackTest(bot, bars=bars, funding=_funding, symbol=_symbol,
+                      market_slipage_percent=_market_slipage_percent, result_cache=_result_cache,
+                      indicator_cache=_indicator_cache).run_cached()
+    equity = [(tstamp, value / result.initialEquity) for tstamp, value in result.equity_curve] if with_equity else None
+    return params, task, result.metrics, equity
+
+
+@contextmanager
+def _worker_pool(bars, workers: int, funding, symbol, market_slipage_percent, result_cache, indicator_cache):
+    ''' pool of workers initialized with the bars (see run_sweep). None for workers=1, then the current process
+    gets initialized and runs everything itself '''
+    if workers <= 1:
+        _init_worker(bars, funding, symbol, market_slipage_percent, result_cache, indicator_cache)
+        yield None
+        return
+    shared = None
+    spec = bars
+    if isinstance(bars, BarStore):
+        shared = bars.to_shared()
+        spec = shared.spec
+    elif backing_store(bars) is not None:
+        # bars from load_bars: the M1 data and the aggregated columns get shared, every worker only builds
+        # its own Bar objects on top of them
+        shared = BarStore.from_bars(bars).to_shared()
+        spec = dict(shared.spec, as_bars=True)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(spec, funding, symbol, market_slipage_percent, result_cache,
+                                           indicator_cache)) as pool:
+            yield pool
+    finally:
+        if shared is not None:
+            shared.unlink()
+
+
+def _submit_all(pool, calls, workers: int):
+    ''' submits fn(*args) for every (fn, args) of calls and yields the results as they finish. only a few runs per
+    worker are submitted ahead, so a large grid doesn't get queued (and kept in memory) all at once '''
+    pending = set()
+    for fn, args in calls:
+        if len(pending) >= 2 * workers:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(pool.submit(fn, *args))
+    for future in as_completed(pending):
+        yield future.result()
+
+
+def grid(min: list, max: list, steps: list):
+    ''' all combinations between min and max (inclusive), first parameter changes fastest '''
+    current = min[:]
+    while True:
+        yield current[:]
+        idx = 0
+        while idx < len(current):
+            current[idx] += steps[idx]
+            if current[idx] <= max[idx]:
+                break
+            current[idx] = min[idx]
+            idx += 1
+        if idx == len(current):
+            return
+
+
+def random_samples(min: list, max: list, steps: list, count: int):
+    ''' count random combinations on the grid between min and max '''
+    for i in range(count):
+        yield [min[idx] + random.randint(0, int((max[idx] - min[idx]) / steps[idx])) * steps[idx]
+               for idx in range(len(min))]
+
+
+def run_sweep(bot_factory: Callable[[list], TradingBot], bars: list, combinations, funding: dict = None,
+              symbol: Symbol = None, workers: int = None, market_slipage_percent=0.15,
+              result_cache: ResultCache = None):
+    ''' runs a backtest for every combination of params and yields (params, metrics) as soon as a run is finished.
+    the runs are distributed on a pool of worker processes (default: one per cpu). the bars are handed to each
+    worker once at startup, not per run. a BarStore, or bars with their subbars in one (like from load_bars), get
+    put into shared memory, so the workers attach to the same data instead of getting a copy of it.
+    bot_factory gets the params and has to return a fresh bot. it must be picklable, so a module level function.
+    with workers=1 everything runs in the current process.
+    with a result_cache, combinations that already ran on the same data are taken from it.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with _worker_pool(bars, workers, funding, symbol, market_slipage_percent, result_cache, None) as pool:
+        if pool is None:
+            for params in combinations:
+                yield _run_combination(bot_factory, list(params))
+            return
+        yield from _submit_all(pool, ((_run_combination, (bot_factory, list(params))) for params in combinations),
+                               workers)
+
+
+def format_metrics(params: list, metrics: dict) -> str:
+    return (" ".join(map(str, params))
+            + " | profit: %.2f | maxDD: %.2f | rel: %.2f | UW days: %.1f | trades: %d"
+            % (metrics["profit"], metrics["maxDD"], metrics["rel"], metrics["uw_days"], metrics["trades"]))
+
+
+def precompute_indicators(bot_factory: Callable[[list], TradingBot], combinations: list, bars: list,
+                          cache: IndicatorCache):
+    ''' calculates the indicators of all combinations on all bars and saves them to the cache.
+    every indicator (by id) gets calculated once, no matter how many combinations use it '''
+    registry = IndicatorRegistry()
+    for params in combinations:
+        bot_factory(params).register_indicators(registry)
+    if len(registry) == 0:
+        return
+    for bar in bars:
+        bar.did_change = True
+    registry.use_cache(cache, bars)
+    registry.on_tick(bars)
+    registry.save_cache(bars)
+
+
+def _run_windows(pool, workers: int, bot_factory: Callable[[list], TradingBot], tasks: list,
+                 with_equity: bool = False):
+    if pool is None:
+        for params, task, start, end in tasks:
+            yield _run_window(bot_factory, params, task, start, end, with_equity)
+        return
+    yield from _submit_all(pool, ((_run_window, (bot_factory, params, task, start, end, with_equity))
+                                  for params, task, start, end in tasks), workers)
+
+
+def score_rel(metrics: dict) -> float:
+    return metrics["rel"]
+
+
+def walk_forward(bot_factory: Callable[[list], TradingBot], bars: list, combinations, train_bars: int,
+                 test_bars: int, step_bars: int = None, funding: dict = None, symbol: Symbol = None,
+                 workers: int = None, market_slipage_percent=0.15, score: Callable[[dict], float] = score_rel,
+                 indicator_cache: IndicatorCache = None, result_cache: ResultCache = None) -> dict:
+    ''' walk-forward optimization: the bars get split into folds of train_bars followed by test_bars, every fold
+    starts step_bars (default test_bars) after the previous one. for every fold all combinations run on the train
+    bars, the one with the best score then runs on the test bars (with the bars it needs for warmup before them).
+    the in-sample runs of all folds and then the out-of-sample runs are distributed on one pool of worker processes,
+    like in run_sweep.
+    with an indicator_cache, the indicators of all combinations get calculated once on all bars and every run loads
+    them from there, so overlapping folds don't calculate them again. the indicators at the start of a fold are then
+    warmed up by the bars before it.
+    returns {"folds": [...], "equity": [...]}: per fold the tstamps of the windows, the chosen params and the in- and
+    out-of-sample metrics. equity is the out-of-sample equity of all folds stitched together as (tstamp, equity),
+    relative to the initial equity: every fold continues where the previous one ended, till the next one starts.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if step_bars is None:
+        step_bars = test_bars
+    combinations = [list(params) for params in combinations]
+
+    def bar_tstamp(idx):  # tstamp of the bar at idx, counted from the oldest bar
+        return bars[len(bars) - 1 - idx].tstamp
+
+    folds = []
+    start = 0
+    while start + train_bars + test_bars <= len(bars) and len(combinations) > 0:
+        folds.append({"train": (start, start + train_bars),
+                      "test": (start + train_bars, start + train_bars + test_bars)})
+        start += step_bars
+    if len(folds) == 0:
+        return {"folds": [], "equity": []}
+
+    if indicator_cache is not None:
+        precompute_indicators(bot_factory, combinations, bars, indicator_cache)
+        indicator_cache = IndicatorCache(indicator_cache.directory, indicator_cache.source, indicator_cache.timeframe,
+                                         indicator_cache.offset, read_only=True)
+
+    with _worker_pool(bars, workers, funding, symbol, market_slipage_percent, result_cache, indicator_cache) as pool:
+        # in-sample: best score per fold, on a tie the first combination
+        best = {}
+        tasks = [(params, (fold_idx, combination_idx)) + fold["train"]
+                 for fold_idx, fold in enumerate(folds) for combination_idx, params in enumerate(combinations)]
+        for params, (fold_idx, combination_idx), metrics, unused in _run_windows(pool, workers, bot_factory, tasks):
+            key = (score(metrics), -combination_idx)
+            if fold_idx not in best or key > best[fold_idx][0]:
+                best[fold_idx] = (key, params, metrics)
+
+        tasks = []
+        for fold_idx, fold in enumerate(folds):
+            params = best[fold_idx][1]
+            fold["params"] = params
+            fold["in_sample"] = best[fold_idx][2]
+            warmup = bot_factory(params).min_bars_needed() + 1
+            tasks.append((params, fold_idx, max(0, fold["test"][0] - warmup), fold["test"][1]))
+        for params, fold_idx, metrics, equity in _run_windows(pool, workers, bot_factory, tasks, with_equity=True):
+            folds[fold_idx]["out_of_sample"] = metrics
+            folds[fold_idx]["equity"] = equity
+
+    stitched = []
+    level = 1
+    for fold_idx, fold in enumerate(folds):
+        first = bar_tstamp(fold["test"][0])
+        until = bar_tstamp(folds[fold_idx + 1]["test"][0]) if fold_idx + 1 < len(folds) else None
+        curve = [(tstamp, value) for tstamp, value in fold.pop("equity")
+                 if tstamp >= first and (until is None or tstamp < until)]
+        stitched += [(tstamp, level * value) for tstamp, value in curve]
+        if len(curve) > 0:
+            level *= curve[-1][1]
+        fold["train"] = (bar_tstamp(fold["train"][0]), bar_tstamp(fold["train"][1] - 1))
+        fold["test"] = (first, bar_tstamp(fold["test"][1] - 1))
+    return {"folds": folds, "equity": stitched}
+
+
+class Search:
+    ''' base of the adaptive searches for run_search. ask returns the next batch as list of (params, fraction),
+    fraction is the part of the bars (the most recent ones) to run on, 1 means all bars. an empty batch ends the
+    search. tell gets the metrics of the batch in the same order.
+    history has (params, fraction, metrics) of every evaluation so far.
+    '''
+
+    def __init__(self):
+        self.history = []
+
+    def ask(self) -> list:
+        return []
+
+    def tell(self, batch: list, metrics: list):
+        pass
+
+
+def _unique(combinations) -> list:
+    result = []
+    seen = set()
+    for params in combinations:
+        if tuple(params) not in seen:
+            seen.add(tuple(params))
+            result.append(list(params))
+    return result
+
+
+class SuccessiveHalving(Search):
+    ''' runs all combinations on the most recent 1/eta^(rounds-1) of the bars. only the best 1/eta of them go on to
+    the next round, on eta times as many bars. the last round runs the remaining ones on all bars.
+    so most combinations only get a cheap partial run, full runs are left for the promising ones.
+    '''
+
+    def __init__(self, combinations, eta: int = 3, rounds: int = 3, score: Callable[[dict], float] = score_rel):
+        super().__init__()
+        self.candidates = _unique(combinations)
+        self.eta = eta
+        self.rounds = rounds
+        self.score = score
+        self.round = 0
+
+    def ask(self) -> list:
+        if self.round >= self.rounds:
+            return []
+        fraction = 1 / self.eta ** (self.rounds - 1 - self.round)
+        return [(params, fraction) for params in self.candidates]
+
+    def tell(self, batch: list, metrics: list):
+        self.round += 1
+        ranked = sorted(range(len(batch)), key=lambda idx: -self.score(metrics[idx]))  # stable: ties keep the order
+        self.candidates = [batch[idx][0] for idx in ranked[:max(1, len(batch) // self.eta)]]
+
+
+class EvolutionarySearch(Search):
+    ''' genetic search on the grid between min and max, every generation runs population combinations on all bars.
+    the elite best ones survive, the others are children of two parents picked by tournament: every param comes
+    from one of them and gets moved by up to 2 steps with a probability of mutation.
+    combinations that already ran are not run again.
+    '''
+
+    def __init__(self, min: list, max: list, steps: list, population: int = 20, generations: int = 10,
+                 elite: int = 2, mutation: float = 0.2, score: Callable[[dict], float] = score_rel, seed=None):
+        super().__init__()
+        self.min = min
+        self.max = max
+        self.steps = steps
+        self.population = population
+        self.generations = generations
+        self.elite = elite
+        self.mutation = mutation
+        self.score = score
+        self.random = random.Random(seed)
+        self.scores = {}  # tuple(params) -> score
+        self.generation = 0
+        self.members = _unique([self.random_params() for i in range(population)])
+
+    def random_params(self) -> list:
+        return [self.min[idx] + self.random.randint(0, int((self.max[idx] - self.min[idx]) / self.steps[idx]))
+                * self.steps[idx] for idx in range(len(self.min))]
+
+    def ask(self) -> list:
+        while self.generation < self.generations:
+            batch = [(params, 1) for params in self.members if tuple(params) not in self.scores]
+            if len(batch) > 0:
+                return batch
+            self.next_generation()
+        return []
+
+    def tell(self, batch: list, metrics: list):
+        for (params, fraction), result in zip(batch, metrics):
+            self.scores[tuple(params)] = self.score(result)
+        self.next_generation()
+
+    def tournament(self, ranked: list) -> list:
+        return ranked[min(self.random.randrange(len(ranked)), self.random.randrange(len(ranked)))]
+
+    def next_generation(self):
+        self.generation += 1
+        ranked = sorted(self.members, key=lambda params: -self.scores[tuple(params)])
+        members = ranked[:self.elite]
+        seen = set(map(tuple, members))
+        attempts = 0
+        while len(members) < self.population and attempts < self.population * 10:
+            attempts += 1
+            first = self.tournament(ranked)
+            second = self.tournament(ranked)
+            child = [first[idx] if self.random.random() < 0.5 else second[idx] for idx in range(len(first))]
+            for idx in range(len(child)):
+                if self.random.random() < self.mutation:
+                    moved = child[idx] + self.random.choice((-2, -1, 1, 2)) * self.steps[idx]
+                    child[idx] = min(self.max[idx], max(self.min[idx], moved))
+            if tuple(child) not in seen:
+                seen.add(tuple(child))
+                members.append(child)
+        self.members = members
+
+
+def run_search(bot_factory: Callable[[list], TradingBot], bars: list, search: Search, funding: dict = None,
+               symbol: Symbol = None, workers: int = None, market_slipage_percent=0.15,
+               result_cache: ResultCache = None):
+    ''' runs the batches of an adaptive search (SuccessiveHalving, EvolutionarySearch) on a pool of workers like
+    run_sweep and yields (params, fraction, metrics) of every run once its batch is finished.
+    a partial run gets the bars the bot needs before the tested part as warmup, a fraction that leaves no bar to test
+    raises a ValueError '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with _worker_pool(bars, workers, funding, symbol, market_slipage_percent, result_cache, None) as pool:
+        while True:
+            batch = search.ask()
+            if len(batch) == 0:
+                return
+            tasks = []
+            for idx, (params, fraction) in enumerate(batch):
+                test = int(len(bars) * fraction)
+                if test < 1:
+                    raise ValueError("fraction %s of %i bars leaves no bars to test" % (fraction, len(bars)))
+                # the bot needs min_bars_needed before the tested bars, like in walk_forward
+                warmup = bot_factory(params).min_bars_needed() + 1
+                tasks.append((list(params), idx, max(0, len(bars) - test - warmup), len(bars)))
+            metrics = [None] * len(batch)
+            for params, idx, result, unused in _run_windows(pool, workers, bot_factory, tasks):
+                metrics[idx] = result
+            search.tell(batch, metrics)
+            for (params, fraction), result in zip(batch, metrics):
+                search.history.append((params, fraction, result))
+                yield params, fraction, result
@@ -10,18 +10,23 @@ from kuegi_bot.exchanges.bitmex.bitmex_interface import BitmexInterface
 from kuegi_bot.exchanges.bybit.bybit_interface import ByBitInterface
 from kuegi_bot.exchanges.bybit_linear.bybitlinear_interface import ByBitLinearInterface
 from kuegi_bot.exchanges.phemex.phemex_interface import PhemexInterface
+from kuegi_bot.indicators.cache import IndicatorCache
 from kuegi_bot.utils import log, errors
 from kuegi_bot.utils.telegram import TelegramBot
+from kuegi_bot.utils.bar_builder import LiveBarBuilder
+from kuegi_bot.utils.market_data import MarketDataHub
 from kuegi_bot.bots.trading_bot import TradingBot
 from kuegi_bot.utils.trading_classes import OrderInterface, Order, Account, Bar, Symbol, ExchangeInterface, OrderType
 
 
 class LiveTrading(OrderInterface):
 
-    def __init__(self, settings, telegram: TelegramBot, trading_bot: TradingBot):
+    def __init__(self, settings, telegram: TelegramBot, trading_bot: TradingBot, market_data: MarketDataHub = None):
         self.settings = settings
         self.id = self.settings.id
         self.last_tick = 0
+        # shared with the other bots on the same symbol, None to use the own exchange interface only
+        self.market_data = market_data
 
         self.logger = log.setup_custom_logger(name=settings.id,
                                               log_level=settings.LOG_LEVEL,
@@ -29,6 +34,11 @@ class LiveTrading(OrderInterface):
                                               logToFile=settings.LOG_TO_FILE)
 
         self.telegram_bot = telegram
+        self.indicator_cache = None
+        if settings.INDICATOR_CACHE_DIR is not None:
+            self.indicator_cache = IndicatorCache(settings.INDICATOR_CACHE_DIR,
+                                                  source=settings.EXCHANGE + "_" + settings.SYMBOL,
+                                                  timeframe=settings.MINUTES_PER_BAR)
 
         self.logger.info("#############################")
         self.logger.info(
@@ -50,6 +60,8 @@ class LiveTrading(OrderInterface):
             self.alive = False
             return
         self.handles_executions= self.exchange.handles_executions
+        if self.market_data is not None:
+            self.market_data.subscribe(self.exchange)
 
         self.alive = True
 
@@ -59,6 +71,8 @@ class LiveTrading(OrderInterface):
             self.symbolInfo: Symbol = self.exchange.get_instrument()
             self.bot: TradingBot = trading_bot
             self.bot.prepare(self.logger, self)
+            # only the last min_bars_needed*2 bars are kept (see update_bars), with room for bars that got replaced
+            self.bot.limit_indicator_rows(self.bot.min_bars_needed() * 4)
             # init market data dict to be filled later
             self.bars: List[Bar] = []
             self.update_bars()
@@ -156,41 +170,19 @@ class LiveTrading(OrderInterface):
     def update_bars(self):
         """get data from exchange"""
         if len(self.bars) < self.bot.min_bars_needed():
-            self.bars = self.exchange.get_bars(self.settings.MINUTES_PER_BAR, 0,self.bot.min_bars_needed())
+            if self.market_data is not None:
+                self.bar_builder = self.market_data.bars(self.settings.MINUTES_PER_BAR, 0, self.bot.min_bars_needed(),
+                                                         max_bars=self.bot.min_bars_needed()*2)
+                self.bars = self.bar_builder.bars
+            else:
+                self.bars = self.exchange.get_bars(self.settings.MINUTES_PER_BAR, 0,self.bot.min_bars_needed())
+                # keeps self.bars up to date from now on, changing only the forming bar
+                self.bar_builder = LiveBarBuilder(self.settings.MINUTES_PER_BAR, 0, bars=self.bars,
+                                                  max_bars=self.bot.min_bars_needed()*2)
+        elif self.market_data is not None:
+            self.market_data.update(self.bar_builder)
         else:
-            new_bars = self.exchange.recent_bars(self.settings.MINUTES_PER_BAR, 0)
-            for b in reversed(new_bars):
-                if b.tstamp < self.bars[0].tstamp:
-                    continue
-                elif b.tstamp == self.bars[0].tstamp:
-                    # merge?
-                    if b.subbars[-1].tstamp == self.bars[0].subbars[-1].tstamp:
-                        b.bot_data = self.bars[0].bot_data  # merge bot data to not loose it
-                        self.bars[0] = b
-                    else:
-                        # merge!
-                        first = self.bars[0].subbars[-1]
-                        newBar = Bar(tstamp=b.tstamp, open=first.open, high=first.high, low=first.low,
-                                     close=first.close,
-                                     volume=first.volume, subbars=[first])
-                        for sub in reversed(self.bars[0].subbars[:-1]):
-                            if sub.tstamp < b.subbars[-1].tstamp:
-                                newBar.add_subbar(sub)
-                            else:
-                                break
-                        for sub in reversed(b.subbars):
-                            if sub.tstamp > newBar.subbars[0].tstamp:
-                                newBar.add_subbar(sub)
-                            else:
-                                continue
-                        newBar.bot_data = self.bars[0].bot_data  # merge bot data to not loose it
-                        self.bars[0] = newBar
-                else:  # b.tstamp > self.bars[0].tstamp
-                    self.bars.insert(0, b)
-        del self.bars[self.bot.min_bars_needed()*2:]
-        for bar in self.bars[5:]:
-            # remove minute data from older bars
-            bar.subbars= []
+            self.exchange.update_bars(self.bar_builder)
 
     def check_connection(self):
         """Ensure the WS connections are still open."""
@@ -200,6 +192,8 @@ class LiveTrading(OrderInterface):
         if not self.alive:
             return
         self.logger.info("Shutting down. open orders are not touched! Close manually!")
+        if self.market_data is not None:
+            self.market_data.unsubscribe(self.exchange)
         try:
             self.exchange.exit()
         except errors.AuthenticationError as e:
@@ -218,7 +212,11 @@ class LiveTrading(OrderInterface):
             self.update_bars()
             self.update_account()
             self.bot.on_tick(self.bars, self.account)
+            if self.indicator_cache is not None and self.bot.is_new_bar:
+                self.bot.save_indicator_cache(self.bars)
             for bar in self.bars:
+                if not bar.did_change:
+                    break  # only the newest bars changed
                 bar.did_change = False
         except Exception as e:
             self.logger.error("Exception in handle_tick: " + traceback.format_exc())
@@ -227,7 +225,11 @@ class LiveTrading(OrderInterface):
     def run_loop(self):
         if self.alive:
             try:
+                if self.indicator_cache is not None:
+                    self.bot.use_indicator_cache(self.indicator_cache, self.bars)
                 self.bot.init(bars=self.bars, account=self.account, symbol=self.symbolInfo, unique_id=self.settings.id)
+                if self.indicator_cache is not None:
+                    self.bot.save_indicator_cache(self.bars)
             except Exception as e:
                 self.logger.error("Exception in bot init: " + traceback.format_exc())
                 self.alive= False
@@ -0,0 +1,90 @@
+from typing import List, Callable
+
+from kuegi_bot.utils.trading_classes import Bar
+
+
+class LiveBarBuilder:
+    ''' keeps the bars of one timeframe (newest first) up to date with low tf bars (f.e. M1 klines) as they come in.
+    an update only changes the forming bar (bars[0]), or adds a new one in front once it belongs to the next bar.
+    updates of closed bars are ignored. did_change gets set on the changed bars only (the forming bar, and the
+    previous one when a new bar starts), the flags stay contiguous from index 0.
+    '''
+
+    def __init__(self, timeframe_minutes: int, start_offset_minutes: int = 0, bars: List[Bar] = None,
+                 max_bars: int = None, bars_with_subbars: int = 5):
+        self.timeframe_minutes = timeframe_minutes
+        self.start_offset_minutes = start_offset_minutes
+        self.bars: List[Bar] = bars if bars is not None else []
+        self.max_bars = max_bars
+        self.bars_with_subbars = bars_with_subbars  # older bars drop their subbars
+        # id -> raw entry of the low tf bars of the last sync, to find the ones that got added or replaced since
+        self._seen = {}
+        if max_bars is not None:
+            del self.bars[max_bars:]
+        for bar in self.bars[bars_with_subbars:]:
+            bar.subbars = []
+
+    def bar_start(self, tstamp) -> int:
+        seconds = 60 * self.timeframe_minutes
+        return int((tstamp - self.start_offset_minutes * 60) / seconds) * seconds
+
+    def add(self, subbar: Bar) -> bool:
+        ''' adds a low tf bar, or replaces the one with the same tstamp. returns True if a bar changed '''
+        if subbar is None or subbar.close is None:
+            return False
+        start = self.bar_start(subbar.tstamp)
+        bars = self.bars
+        if len(bars) == 0 or start > bars[0].tstamp:
+            bars.insert(0, Bar(tstamp=start, open=subbar.open, high=subbar.high, low=subbar.low, close=subbar.close,
+                               volume=subbar.volume, subbars=[subbar]))
+            if len(bars) > 1:
+                bars[1].did_change = True  # got closed
+            if self.max_bars is not None:
+                del bars[self.max_bars:]
+            if len(bars) > self.bars_with_subbars:
+                bars[self.bars_with_subbars].subbars = []
+            return True
+        bar = bars[0]
+        if start < bar.tstamp or bar.close is None:
+            return False
+        subbars = bar.subbars
+        if len(subbars) == 0 or subbar.tstamp > subbars[0].tstamp:
+            bar.add_subbar(subbar)
+            return True
+        idx = 0
+        while idx < len(subbars) and subbars[idx].tstamp > subbar.tstamp:
+            idx += 1
+        if idx < len(subbars) and subbars[idx].tstamp == subbar.tstamp:
+            subbars[idx] = subbar
+        else:
+            subbars.insert(idx, subbar)
+        # a replaced subbar might lower the high or raise the low, so it needs all of them
+        bar.open = subbars[-1].open
+        bar.high = max(sub.high for sub in subbars)
+        bar.low = min(sub.low for sub in subbars)
+        bar.close = subbars[0].close
+        bar.volume = sum(sub.volume for sub in subbars)
+        bar.last_tick_tstamp = max(sub.last_tick_tstamp for sub in subbars)
+        bar.did_change = True
+        return True
+
+    def sync(self, subbars: list, to_bar: Callable = None, lookback: int = 3) -> bool:
+        ''' adds the entries of a buffer of low tf bars (newest first) that are new or got replaced since the last
+        sync. the newest lookback entries are always checked, after that it stops at the first known one.
+        the newest entry is always taken, it might got changed in place.
+        to_bar converts an entry into a Bar (None to skip it). returns True if a bar changed '''
+        fresh = []
+        idx = 0
+        while idx < len(subbars):
+            raw = subbars[idx]
+            if id(raw) not in self._seen or idx == 0:
+                fresh.append(raw)
+            elif idx >= lookback:
+                break
+            idx += 1
+        self._seen = {id(raw): raw for raw in subbars[:idx + 1]}
+        changed = False
+        for raw in reversed(fresh):
+            if self.add(to_bar(raw) if to_bar is not None else raw):
+                changed = True
+        return changed
@@ -0,0 +1,397 @@
+from typing import List
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from kuegi_bot.utils.trading_classes import Bar
+
+
+class StoredBar:
+    ''' thin view on one row of a BarStore. behaves like a Bar (same attributes) but keeps no data of its own.
+    all reads and writes go to the columns of the store, so multiple views on the same row see the same data.
+    '''
+    __slots__ = ("_store", "_pos")
+
+    def __init__(self, store, pos: int):
+        self._store = store
+        self._pos = pos
+
+    @property
+    def tstamp(self) -> int:
+        return self._store.tstamp.item(self._pos)
+
+    @tstamp.setter
+    def tstamp(self, value):
+        self._store.tstamp[self._pos] = value
+
+    @property
+    def open(self) -> float:
+        return self._store.open.item(self._pos)
+
+    @open.setter
+    def open(self, value):
+        self._store.open[self._pos] = value
+
+    @property
+    def high(self) -> float:
+        return self._store.high.item(self._pos)
+
+    @high.setter
+    def high(self, value):
+        self._store.high[self._pos] = value
+
+    @property
+    def low(self) -> float:
+        return self._store.low.item(self._pos)
+
+    @low.setter
+    def low(self, value):
+        self._store.low[self._pos] = value
+
+    @property
+    def close(self) -> float:
+        return self._store.close.item(self._pos)
+
+    @close.setter
+    def close(self, value):
+        self._store.close[self._pos] = value
+
+    @property
+    def volume(self) -> float:
+        return self._store.volume.item(self._pos)
+
+    @volume.setter
+    def volume(self, value):
+        self._store.volume[self._pos] = value
+
+    @property
+    def last_tick_tstamp(self) -> float:
+        return self._store.last_tick_tstamp.item(self._pos)
+
+    @last_tick_tstamp.setter
+    def last_tick_tstamp(self, value):
+        self._store.last_tick_tstamp[self._pos] = value
+
+    @property
+    def did_change(self) -> bool:
+        return self._store.did_change.item(self._pos)
+
+    @did_change.setter
+    def did_change(self, value):
+        self._store.did_change[self._pos] = value
+
+    @property
+    def bot_data(self) -> dict:
+        return self._store.get_bot_data(self._pos)
+
+    @bot_data.setter
+    def bot_data(self, value):
+        self._store.set_bot_data(self._pos, value)
+
+    @property
+    def subbars(self):
+        return self._store.subbars_of(self._pos)
+
+    @property
+    def buyVolume(self) -> float:
+        return 0
+
+    @property
+    def sellVolume(self) -> float:
+        return 0
+
+    def __str__(self):
+        result = "%s (%i) %.1f/%.1f\\%.1f-%.1f %.1f" % (
+            datetime.fromtimestamp(self.tstamp), self.tstamp, self.open, self.high, self.low, self.close, self.volume)
+        subbars = self.subbars
+        if len(subbars) > 0:
+            result += "\n         ["
+            for sub in subbars:
+                result += "\n           " + str(sub) + ","
+            result += "\n         ]"
+        return result
+
+
+class SubbarView:
+    ''' read-only sequence of the rows [start, end) of a store, newest first like every bar list in the bot.
+    used as subbars of aggregated bars: the data stays in the contiguous columns of the M1 store, so there is no
+    object per subbar. items are StoredBar views, the backtest reads the columns directly (see columns).
+    '''
+    __slots__ = ("_store", "_start", "_end")
+
+    def __init__(self, store, start: int, end: int):
+        self._store = store
+        self._start = start
+        self._end = end
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [StoredBar(self._store, self._end - 1 - i) for i in range(*idx.indices(len(self)))]
+        length = self._end - self._start
+        if idx < 0:
+            idx += length
+        if idx < 0 or idx >= length:
+            raise IndexError("subbar index out of range")
+        return StoredBar(self._store, self._end - 1 - idx)
+
+    def __iter__(self):
+        for pos in range(self._end - 1, self._start - 1, -1):
+            yield StoredBar(self._store, pos)
+
+    def __reversed__(self):
+        for pos in range(self._start, self._end):
+            yield StoredBar(self._store, pos)
+
+    def columns(self, names) -> list:
+        ''' the given columns of the subbars, oldest first. views on the data of the store, not copies '''
+        return [getattr(self._store, name)[self._start:self._end] for name in names]
+
+
+def backing_store(bars):
+    ''' the store all subbars of the bars are views on (SubbarView, like from BarStore.to_bars).
+    None if there are no bars or some of the subbars are something else '''
+    if len(bars) == 0 or not isinstance(bars[0].subbars, SubbarView):
+        return None
+    store = bars[0].subbars._store
+    for bar in bars:
+        if not isinstance(bar.subbars, SubbarView) or bar.subbars._store is not store:
+            return None
+    return store
+
+
+class SharedBarStore:
+    ''' owns the shared memory blocks with the columns of a BarStore.
+    spec is a small picklable description that gets send to other processes, which attach to the data with
+    BarStore.attach(spec) without copying or parsing anything.
+    the owner has to call unlink() once all processes are done.
+    '''
+
+    def __init__(self, store):
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self.spec: dict = self._share(store)
+
+    def _share(self, store) -> dict:
+        columns = {}
+        for name in BarStore.SHARED_COLUMNS + BarStore.PRIVATE_COLUMNS:
+            data = getattr(store, name)
+            if data is None:
+                continue
+            data = np.ascontiguousarray(data)
+            block = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+            np.ndarray(data.shape, dtype=data.dtype, buffer=block.buf)[:] = data
+            self._blocks.append(block)
+            columns[name] = (block.name, data.dtype.str, len(data))
+        return {"columns": columns, "start": store._start, "end": store._end,
+                "subbars": self._share(store.subbars) if store.subbars is not None else None}
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+
+    def unlink(self):
+        self.close()
+        for block in self._blocks:
+            block.unlink()
+        self._blocks = []
+
+
+class BarStore:
+    ''' columnar container for bars: one contiguous numpy array per field instead of one Bar object per bar.
+    the columns are in chronological order, but the store is indexed like every bar list in the bot:
+    index 0 is the newest bar. indexing returns StoredBar views, slicing returns a list of views.
+
+    aggregated bars keep their subbars as a range [sub_start, sub_end) into a second store with the M1 data.
+    '''
+
+    # columns that are read-only when attached to shared memory
+    SHARED_COLUMNS = ("tstamp", "open", "high", "low", "close", "volume", "sub_start", "sub_end")
+    # columns the backtest writes to, every process gets its own copy of those
+    PRIVATE_COLUMNS = ("last_tick_tstamp",)
+
+    def __init__(self, tstamp, open, high, low, close, volume, last_tick_tstamp=None,
+                 subbars=None, sub_start=None, sub_end=None):
+        self.tstamp: np.ndarray = np.asarray(tstamp, dtype=np.int64)
+        self.open: np.ndarray = np.asarray(open, dtype=np.float64)
+        self.high: np.ndarray = np.asarray(high, dtype=np.float64)
+        self.low: np.ndarray = np.asarray(low, dtype=np.float64)
+        self.close: np.ndarray = np.asarray(close, dtype=np.float64)
+        self.volume: np.ndarray = np.asarray(volume, dtype=np.float64)
+        if last_tick_tstamp is None:
+            last_tick_tstamp = self.tstamp
+        self.last_tick_tstamp: np.ndarray = np.array(last_tick_tstamp, dtype=np.float64)
+        self.did_change: np.ndarray = np.ones(len(self.tstamp), dtype=bool)
+        self.subbars: BarStore = subbars
+        self.sub_start: np.ndarray = np.asarray(sub_start, dtype=np.int64) if sub_start is not None else None
+        self.sub_end: np.ndarray = np.asarray(sub_end, dtype=np.int64) if sub_end is not None else None
+        # bot_data is only allocated for bars that get some, keyed by the position in the columns
+        self._bot_data: dict = {}
+        # the visible range of the columns. windows on the same columns share all data
+        self._start = 0
+        self._end = len(self.tstamp)
+
+    def to_shared(self) -> SharedBarStore:
+        ''' copies the columns (incl. subbars) into shared memory. see SharedBarStore '''
+        return SharedBarStore(self)
+
+    @staticmethod
+    def attach(spec: dict):
+        ''' creates a store on the shared memory described by spec (from SharedBarStore.spec).
+        the data is not copied and read-only, except last_tick_tstamp, did_change and bot_data which are private to
+        this process. '''
+        blocks = []
+        columns = {}
+        for name, (block_name, dtype, length) in spec["columns"].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            data = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+            if name in BarStore.PRIVATE_COLUMNS:
+                data = data.copy()
+            else:
+                data.flags.writeable = False
+            columns[name] = data
+        subbars = BarStore.attach(spec["subbars"]) if spec["subbars"] is not None else None
+        store = BarStore(tstamp=columns["tstamp"], open=columns["open"], high=columns["high"], low=columns["low"],
+                         close=columns["close"], volume=columns["volume"],
+                         last_tick_tstamp=columns["last_tick_tstamp"], subbars=subbars,
+                         sub_start=columns.get("sub_start"), sub_end=columns.get("sub_end"))
+        # keeps the shared memory mapped as long as the store lives
+        store._shared_blocks = blocks
+        store._start = spec["start"]
+        store._end = spec["end"]
+        return store
+
+    def __len__(self):
+        return self._end - self._start
+
+    def _pos_of(self, idx: int) -> int:
+        length = self._end - self._start
+        if idx < 0:
+            idx += length
+        if idx < 0 or idx >= length:
+            raise IndexError("bar index out of range")
+        return self._end - 1 - idx
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [StoredBar(self, self._end - 1 - i) for i in range(*idx.indices(len(self)))]
+        return StoredBar(self, self._pos_of(idx))
+
+    def __iter__(self):
+        for pos in range(self._end - 1, self._start - 1, -1):
+            yield StoredBar(self, pos)
+
+    def __reversed__(self):
+        for pos in range(self._start, self._end):
+            yield StoredBar(self, pos)
+
+    def get_bot_data(self, pos: int) -> dict:
+        data = self._bot_data.get(pos)
+        if data is None:
+            data = {"indicators": {}}
+            self._bot_data[pos] = data
+        return data
+
+    def set_bot_data(self, pos: int, value: dict):
+        self._bot_data[pos] = value
+
+    def subbars_of(self, pos: int):
+        if self.subbars is None:
+            return []
+        return SubbarView(self.subbars, self.sub_start.item(pos), self.sub_end.item(pos))
+
+    def to_bars(self) -> List[Bar]:
+        ''' the bars as list of Bar objects (newest first). the subbars stay in the store (see SubbarView) '''
+        start = self._start
+        end = self._end
+        rows = zip(self.tstamp[start:end].tolist(), self.open[start:end].tolist(), self.high[start:end].tolist(),
+                   self.low[start:end].tolist(), self.close[start:end].tolist(), self.volume[start:end].tolist(),
+                   self.last_tick_tstamp[start:end].tolist())
+        result = []
+        for pos, (tstamp, open, high, low, close, volume, last_tick) in enumerate(rows, start):
+            bar = Bar(tstamp=tstamp, open=open, high=high, low=low, close=close, volume=volume)
+            bar.last_tick_tstamp = last_tick
+            if self.subbars is not None:
+                bar.subbars = self.subbars_of(pos)
+            result.append(bar)
+        result.reverse()
+        return result
+
+    def freeze(self):
+        ''' makes the columns read-only, incl. the ones of the subbars '''
+        for name in BarStore.SHARED_COLUMNS + BarStore.PRIVATE_COLUMNS:
+            data = getattr(self, name)
+            if data is not None:
+                data.flags.writeable = False
+        if self.subbars is not None:
+            self.subbars.freeze()
+
+    @staticmethod
+    def from_bars(bars: List[Bar]):
+        ''' converts a list of bars (newest first) into a store. subbars get stored too. '''
+        count = len(bars)
+        chronological = list(reversed(bars))
+
+        def column(attr, dtype):
+            return np.fromiter((getattr(b, attr) for b in chronological), dtype=dtype, count=count)
+
+        subbars = None
+        sub_start = None
+        sub_end = None
+        backing = backing_store(bars)
+        if backing is not None:
+            # the subbars already are rows of one store (f.e. from to_bars), it gets referenced instead of copied
+            subbars = backing
+            sub_start = np.fromiter((b.subbars._start for b in chronological), dtype=np.int64, count=count)
+            sub_end = np.fromiter((b.subbars._end for b in chronological), dtype=np.int64, count=count)
+        elif any(len(b.subbars) > 0 for b in chronological):
+            all_subs = []
+            sub_start = np.empty(count, dtype=np.int64)
+            sub_end = np.empty(count, dtype=np.int64)
+            for idx, b in enumerate(chronological):
+                sub_start[idx] = len(all_subs)
+                all_subs.extend(reversed(b.subbars))
+                sub_end[idx] = len(all_subs)
+            all_subs.reverse()
+            subbars = BarStore.from_bars(all_subs)
+
+        return BarStore(tstamp=column("tstamp", np.int64), open=column("open", np.float64),
+                        high=column("high", np.float64), low=column("low", np.float64),
+                        close=column("close", np.float64), volume=column("volume", np.float64),
+                        last_tick_tstamp=column("last_tick_tstamp", np.float64),
+                        subbars=subbars, sub_start=sub_start, sub_end=sub_end)
+
+    @staticmethod
+    def aggregate(m1, timeframe_minutes, start_offset_minutes=0):
+        ''' vectorized version of process_low_tf_bars: aggregates the store m1 into bars of the given timeframe.
+        the result references m1 as subbars.
+        '''
+        tstamp = m1.tstamp[m1._start:m1._end]
+        if len(tstamp) > 1 and np.any(tstamp[1:] < tstamp[:-1]):
+            order = np.argsort(tstamp, kind="stable")
+            m1 = BarStore(tstamp=tstamp[order], open=m1.open[m1._start:m1._end][order],
+                          high=m1.high[m1._start:m1._end][order], low=m1.low[m1._start:m1._end][order],
+                          close=m1.close[m1._start:m1._end][order], volume=m1.volume[m1._start:m1._end][order],
+                          last_tick_tstamp=m1.last_tick_tstamp[m1._start:m1._end][order])
+            tstamp = m1.tstamp
+        first = m1._start
+        seconds = 60 * timeframe_minutes
+        # same as int((tstamp - offset) / seconds) * seconds for the (positive) tstamps we deal with
+        bar_start = ((tstamp - start_offset_minutes * 60) // seconds) * seconds
+        if len(bar_start) == 0:
+            return BarStore(tstamp=[], open=[], high=[], low=[], close=[], volume=[], subbars=m1,
+                            sub_start=[], sub_end=[])
+        starts = np.concatenate(([0], np.flatnonzero(bar_start[1:] != bar_start[:-1]) + 1))
+        ends = np.append(starts[1:], len(bar_start))
+        sl = slice(first, m1._end)
+        return BarStore(tstamp=bar_start[starts],
+                        open=m1.open[sl][starts],
+                        high=np.maximum.reduceat(m1.high[sl], starts),
+                        low=np.minimum.reduceat(m1.low[sl], starts),
+                        close=m1.close[sl][ends - 1],
+                        volume=np.add.reduceat(m1.volume[sl], starts),
+                        last_tick_tstamp=np.maximum.reduceat(m1.last_tick_tstamp[sl], starts),
+                        subbars=m1, sub_start=starts + first, sub_end=ends + first)
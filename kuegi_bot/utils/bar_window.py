@@ -0,0 +1,65 @@
+from kuegi_bot.utils.trading_classes import Bar
+
+
+class BarWindow:
+    ''' read-only view on a part of a bar history (list of bars or BarStore, newest bar = index 0).
+    window[0] is history[start], or an optional head bar (f.e. the currently forming bar) that is shown in front
+    of the history without being inserted into it.
+    slicing returns another window on the same history, so nothing gets copied.
+    '''
+    __slots__ = ("_history", "_start", "_stop", "_head")
+
+    def __init__(self, history, start: int = 0, stop: int = None, head: Bar = None):
+        self._history = history
+        self._start = start
+        self._stop = stop if stop is not None else len(history)
+        self._head = head
+
+    def __len__(self):
+        return self._stop - self._start + (1 if self._head is not None else 0)
+
+    def __getitem__(self, idx):
+        if type(idx) is not int:
+            if isinstance(idx, slice):
+                return self._slice(idx)
+            idx = int(idx)
+        if idx >= 0:
+            if self._head is not None:
+                if idx == 0:
+                    return self._head
+                idx -= 1
+            idx += self._start
+        else:
+            idx += self._stop
+            if self._head is not None and idx == self._start - 1:
+                return self._head
+        if self._start <= idx < self._stop:
+            return self._history[idx]
+        raise IndexError("bar index out of range")
+
+    def _slice(self, sl: slice):
+        start, stop, step = sl.indices(len(self))
+        if step != 1:
+            return [self[idx] for idx in range(start, stop, step)]
+        stop = max(start, stop)
+        if self._head is None:
+            return BarWindow(self._history, self._start + start, self._start + stop)
+        if start == 0:
+            if stop == 0:
+                return BarWindow(self._history, self._start, self._start)
+            return BarWindow(self._history, self._start, self._start + stop - 1, self._head)
+        return BarWindow(self._history, self._start + start - 1, self._start + stop - 1)
+
+    def __iter__(self):
+        if self._head is not None:
+            yield self._head
+        history = self._history
+        for idx in range(self._start, self._stop):
+            yield history[idx]
+
+    def __reversed__(self):
+        history = self._history
+        for idx in range(self._stop - 1, self._start - 1, -1):
+            yield history[idx]
+        if self._head is not None:
+            yield self._head
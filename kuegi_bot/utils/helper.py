@@ -1,9 +1,13 @@
+import hashlib
 import json
 import logging
+import os
 import sys
 from datetime import datetime
 from typing import List
 
+import numpy as np
+
 from kuegi_bot.exchanges.bybit.bybit_interface import ByBitInterface
 from kuegi_bot.exchanges.bybit_linear.bybitlinear_interface import ByBitLinearInterface
 from kuegi_bot.exchanges.phemex.phemex_interface import PhemexInterface
@@ -14,7 +18,7 @@ from kuegi_bot.utils import log
 import plotly.graph_objects as go
 
 from kuegi_bot.utils.dotdict import dotdict
-from kuegi_bot.utils.trading_classes import Bar, process_low_tf_bars
+from kuegi_bot.utils.bar_store import BarStore
 
 logger = log.setup_custom_logger()
 
@@ -53,24 +57,121 @@ def history_file_name(index, exchange,symbol='') :
         symbol += "_"
     return 'history/' + exchange + '/' + symbol + 'M1_' + str(index) + '.json'
 
-known_history_files= {
-    "bitmex_XBTUSD": 49,
-    "bybit_BTCUSD": 28,
-    "bybit_ETHUSD":23,
-    "bybit_XRPUSD":14,
-    "bybit_BTCUSDM21":1,
-    "bybit-linear_BTCUSDT":9,
-    "bybit-linear_LINKUSDT":3,
-    "bybit-linear_ETHUSDT":3,
-    "bybit-linear_LTCUSDT":3,
-    "binance_BTCUSDT": 9,
-    "binanceSpot_BTCUSD": 28,
-    "phemex_BTCUSD": 6,
-    "bitstamp_btceur": 99,
-    "bitstamp_etheur": 35,
-    "bitstamp_xrpeur": 42,
-    "bitstamp_eurusd": 94
-    }
+def history_manifest_file_name(exchange, symbol=''):
+    if len(symbol) > 0:
+        symbol += "_"
+    return 'history/' + exchange + '/' + symbol + 'manifest.json'
+
+
+def _row_tstamp(row, exchange):
+    """ tstamp of a raw history entry as written by the crawler """
+    if isinstance(row, list):
+        return int(row[0] / 1000) if exchange in ['binance_future', 'binanceSpot', 'binance'] else int(row[0])
+    if 'tstamp' in row:
+        return int(row['tstamp'])
+    if 'open_time' in row:
+        return int(row['open_time'])
+    if 'start' in row:
+        return int(row['start'] / 1000)
+    return int(row['timestamp'])
+
+
+def _file_checksum(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def _file_stat(filename):
+    """ size and mtime of a file, to see if it changed without reading it """
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def history_manifest_entry(index, rows: list, exchange, symbol):
+    """ describes one history file: index, first/last tstamp, number of rows, checksum, size and mtime of the file """
+    filename = history_file_name(index, exchange, symbol)
+    size, mtime = _file_stat(filename)
+    return {"index": index,
+            "first": _row_tstamp(rows[0], exchange) if len(rows) > 0 else None,
+            "last": _row_tstamp(rows[-1], exchange) if len(rows) > 0 else None,
+            "rows": len(rows),
+            "checksum": _file_checksum(filename),
+            "size": size,
+            "mtime": mtime}
+
+
+def _write_history_manifest(manifest, exchange, symbol):
+    with open(history_manifest_file_name(exchange, symbol), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def _read_history_manifest(exchange, symbol):
+    try:
+        with open(history_manifest_file_name(exchange, symbol)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"files": []}
+
+
+def update_history_manifest(exchange, symbol, index, rows: list):
+    """ called by the crawler after writing a history file """
+    manifest = _read_history_manifest(exchange, symbol)
+    files = [entry for entry in manifest["files"] if entry["index"] != index]
+    files.append(history_manifest_entry(index, rows, exchange, symbol))
+    files.sort(key=lambda entry: entry["index"])
+    manifest["files"] = files
+    _write_history_manifest(manifest, exchange, symbol)
+
+
+def load_history_manifest(exchange='bybit', symbol='BTCUSD'):
+    """ the manifest of the history files of the symbol. files without an entry (f.e. from an old crawler) or
+    with a wrong checksum get (re-)indexed and the manifest is saved.
+    the checksum is only calculated if size or mtime of the file differ from the entry. """
+    manifest = _read_history_manifest(exchange, symbol)
+    entries = {entry["index"]: entry for entry in manifest["files"]}
+    changed = False
+    index = 0
+    while os.path.exists(history_file_name(index, exchange, symbol)):
+        filename = history_file_name(index, exchange, symbol)
+        entry = entries.get(index)
+        size, mtime = _file_stat(filename)
+        if entry is not None and entry.get("size") == size and entry.get("mtime") == mtime:
+            index += 1
+            continue
+        if entry is None or entry["checksum"] != _file_checksum(filename):
+            logger.info("indexing history file %i of %s %s" % (index, exchange, symbol))
+            with open(filename) as f:
+                entries[index] = history_manifest_entry(index, json.load(f), exchange, symbol)
+        else:
+            # only touched, the content is the same
+            entry["size"] = size
+            entry["mtime"] = mtime
+        changed = True
+        index += 1
+    for missing in [idx for idx in entries.keys() if idx >= index]:
+        del entries[missing]
+        changed = True
+    manifest["files"] = [entries[idx] for idx in sorted(entries.keys())]
+    if changed and index > 0:
+        _write_history_manifest(manifest, exchange, symbol)
+    return manifest
+
+
+def last_history_file_index(exchange='bybit', symbol='BTCUSD'):
+    """ index of the last history file of the symbol, -1 if there is none """
+    files = load_history_manifest(exchange, symbol)["files"]
+    return files[-1]["index"] if len(files) > 0 else -1
+
+
+def history_npy_file_name(exchange, symbol=''):
+    if len(symbol) > 0:
+        symbol += "_"
+    return 'history/' + exchange + '/' + symbol + 'M1.npy'
+
+
+# one record per M1 bar in the binary history files
+M1_DTYPE = np.dtype([("tstamp", np.int64), ("open", np.float64), ("high", np.float64), ("low", np.float64),
+                     ("close", np.float64), ("volume", np.float64), ("last_tick_tstamp", np.float64)])
 
 
 def load_funding(exchange='bybit',symbol='BTCUSD'):
@@ -86,37 +187,162 @@ def load_funding(exchange='bybit',symbol='BTCUSD'):
         return None
 
 
-def load_bars(days_in_history, wanted_tf, start_offset_minutes=0,exchange='bybit',symbol='BTCUSD'):
-    #empty symbol is legacy and means btcusd
-    end = known_history_files[exchange+"_"+symbol]
-    start = max(0,end - int(days_in_history * 1440 / 50000)-1)
+def _read_m1_history(days_in_history, exchange, symbol):
+    """ reads the raw history entries of the last days_in_history (None = everything).
+    only the files that overlap with the wanted window get read.
+    returns the entries and the first wanted tstamp """
+    files = [entry for entry in load_history_manifest(exchange, symbol)["files"] if entry["rows"] > 0]
+    if len(files) == 0:
+        raise FileNotFoundError("no history for %s %s" % (exchange, symbol))
+    start_tstamp = None
+    if days_in_history is not None:
+        start_tstamp = max(entry["last"] for entry in files) - days_in_history * 1440 * 60 + 60
+        files = [entry for entry in files if entry["last"] >= start_tstamp]
     m1_bars_temp = []
-    logger.info("loading " + str(end - start+1) + " history files from "+exchange)
-    for i in range(start, end + 1):
-        with open(history_file_name(i,exchange,symbol)) as f:
+    logger.info("loading " + str(len(files)) + " history files from "+exchange)
+    for entry in files:
+        with open(history_file_name(entry["index"],exchange,symbol)) as f:
             m1_bars_temp += json.load(f)
     logger.info("done loading files, now preparing them")
-    start = int(max(0,len(m1_bars_temp)-(days_in_history * 1440)))
-    m1_bars = m1_bars_temp[start:]
+    return m1_bars_temp, start_tstamp
+
 
-    subbars: List[Bar] = []
+def _iter_m1_bars(m1_bars, wanted_tf, exchange, start_tstamp=None):
+    """ converts the raw history entries to bars, oldest first """
     for b in m1_bars:
+        if start_tstamp is not None and _row_tstamp(b, exchange) < start_tstamp:
+            continue
         if exchange == 'bybit':
             if b['open'] is None:
                 continue
-            subbars.append(ByBitInterface.barDictToBar(b))
+            yield ByBitInterface.barDictToBar(b)
         elif exchange == 'bybit-linear':
             if b['open'] is None:
                 continue
-            subbars.append(ByBitLinearInterface.barDictToBar(b))
+            yield ByBitLinearInterface.barDictToBar(b)
         elif exchange == 'bitmex':
             if b['open'] is None:
                 continue
-            subbars.append(BitmexInterface.barDictToBar(b,wanted_tf))
+            yield BitmexInterface.barDictToBar(b,wanted_tf)
         elif exchange == 'phemex':
-            subbars.append(PhemexInterface.barArrayToBar(b,10000))
-    subbars.reverse()
-    return process_low_tf_bars(subbars, wanted_tf, start_offset_minutes)
+            yield PhemexInterface.barArrayToBar(b,10000)
+
+
+def _history_source(manifest) -> dict:
+    """ what the binary history is made of: number of rows and last tstamp of all json files in the manifest """
+    files = [entry for entry in manifest["files"] if entry["rows"] > 0]
+    return {"rows": sum(entry["rows"] for entry in files),
+            "last": max((entry["last"] for entry in files), default=None)}
+
+
+def convert_history_to_npy(exchange='bybit', symbol='BTCUSD'):
+    """ conversion of the json history files of a symbol into one binary file (see load_m1_history).
+    the bars are sorted by tstamp, duplicates are removed. the source gets noted in the manifest, so a binary
+    history that misses newer json files is detected. """
+    [m1_bars, unused] = _read_m1_history(None, exchange, symbol)
+    data = np.empty(len(m1_bars), dtype=M1_DTYPE)
+    count = 0
+    for bar in _iter_m1_bars(m1_bars, 1, exchange):
+        data[count] = (bar.tstamp, bar.open, bar.high, bar.low, bar.close, bar.volume, bar.last_tick_tstamp)
+        count += 1
+    del m1_bars
+    data = data[:count]
+    data = data[np.argsort(data["tstamp"], kind="stable")]
+    # keep the last one of duplicate tstamps (newer file wins)
+    data = data[np.append(data["tstamp"][1:] != data["tstamp"][:-1], True)]
+    filename = history_npy_file_name(exchange, symbol)
+    np.save(filename, data)
+    manifest = load_history_manifest(exchange, symbol)
+    manifest["npy"] = dict(_history_source(manifest), count=len(data))
+    _write_history_manifest(manifest, exchange, symbol)
+    logger.info("wrote %i M1 bars to %s" % (len(data), filename))
+    return filename
+
+
+def _npy_up_to_date(m1_history, exchange, symbol) -> bool:
+    """ True if the binary history contains all json files of the manifest (and nothing else) """
+    manifest = load_history_manifest(exchange, symbol)
+    if len(manifest["files"]) == 0:
+        return True  # nothing to compare with, only the binary history is there
+    source = manifest.get("npy")
+    return source is not None and source.get("count") == len(m1_history) \
+        and dict(source, count=None) == dict(_history_source(manifest), count=None)
+
+
+def load_m1_history(exchange='bybit', symbol='BTCUSD'):
+    """ memory maps the binary history of the symbol. nothing is read until it gets accessed.
+    if the crawler added json files since it got written, it gets converted again.
+    returns None if there is no (up to date) binary history. """
+    filename = history_npy_file_name(exchange, symbol)
+    try:
+        m1_history = np.load(filename, mmap_mode='r')
+    except FileNotFoundError:
+        return None
+    if _npy_up_to_date(m1_history, exchange, symbol):
+        return m1_history
+    logger.info("binary history %s is outdated, converting it again" % filename)
+    del m1_history  # release the mapping before the file gets replaced
+    try:
+        convert_history_to_npy(exchange, symbol)
+    except OSError as e:
+        logger.warning("could not update %s (%s), using the json files" % (filename, e))
+        return None
+    return np.load(filename, mmap_mode='r')
+
+
+def history_index_of(m1_history, tstamp) -> int:
+    """ index of the first bar in the M1 history with a tstamp >= the given one.
+    O(1) as long as there are no gaps before the bar, binary search otherwise. """
+    tstamps = m1_history["tstamp"]
+    if len(tstamps) == 0:
+        return 0
+    guess = int((tstamp - tstamps[0]) // 60)
+    if 0 <= guess < len(tstamps) and tstamps[guess] == tstamp:
+        return guess
+    return int(np.searchsorted(tstamps, tstamp, side='left'))
+
+
+def _m1_window(m1_history, days_in_history):
+    """ the part of the binary history that is within the last days_in_history """
+    if len(m1_history) == 0:
+        return m1_history
+    last = int(m1_history["tstamp"][-1])
+    return m1_history[history_index_of(m1_history, last - days_in_history * 1440 * 60 + 60):]
+
+
+def load_bars(days_in_history, wanted_tf, start_offset_minutes=0,exchange='bybit',symbol='BTCUSD'):
+    """ the subbars of the bars are read-only views on one store with all the M1 data (see SubbarView),
+    instead of one Bar object per M1 bar """
+    m1 = _load_m1_store(days_in_history, wanted_tf, exchange, symbol)
+    m1.freeze()
+    return BarStore.aggregate(m1, wanted_tf, start_offset_minutes).to_bars()
+
+
+def _load_m1_store(days_in_history, wanted_tf, exchange, symbol) -> BarStore:
+    m1_history = load_m1_history(exchange, symbol)
+    if m1_history is not None:
+        window = _m1_window(m1_history, days_in_history)
+        return BarStore(tstamp=np.array(window["tstamp"]), open=np.array(window["open"]),
+                        high=np.array(window["high"]), low=np.array(window["low"]),
+                        close=np.array(window["close"]), volume=np.array(window["volume"]),
+                        last_tick_tstamp=window["last_tick_tstamp"])
+
+    m1_bars, start_tstamp = _read_m1_history(days_in_history, exchange, symbol)
+    columns = [np.empty(len(m1_bars), dtype=np.int64)] + [np.empty(len(m1_bars)) for i in range(6)]
+    count = 0
+    for bar in _iter_m1_bars(m1_bars, wanted_tf, exchange, start_tstamp):
+        columns[0][count] = bar.tstamp
+        columns[1][count] = bar.open
+        columns[2][count] = bar.high
+        columns[3][count] = bar.low
+        columns[4][count] = bar.close
+        columns[5][count] = bar.volume
+        columns[6][count] = bar.last_tick_tstamp
+        count += 1
+    del m1_bars
+    tstamp, open, high, low, close, volume, last_tick = [c[:count] for c in columns]
+    return BarStore(tstamp=tstamp, open=open, high=high, low=low, close=close, volume=volume,
+                    last_tick_tstamp=last_tick)
 
 
 def prepare_plot(bars, indis: List[Indicator]):
@@ -0,0 +1,99 @@
+import threading
+from typing import List
+
+from kuegi_bot.utils.bar_builder import LiveBarBuilder
+from kuegi_bot.utils.trading_classes import Bar, ExchangeInterface
+
+
+def copy_bar(bar: Bar) -> Bar:
+    ''' a bar with the same data but its own bot_data, did_change and list of subbars (the subbars are shared) '''
+    result = Bar(tstamp=bar.tstamp, open=bar.open, high=bar.high, low=bar.low, close=bar.close, volume=bar.volume,
+                 subbars=list(bar.subbars))
+    result.buyVolume = bar.buyVolume
+    result.sellVolume = bar.sellVolume
+    result.last_tick_tstamp = bar.last_tick_tstamp
+    return result
+
+
+class MarketDataHub:
+    ''' market data of one symbol on one exchange, shared by all bots trading it.
+    the low tf buffer (M1 klines) of one exchange interface (the feed) is used for all of them: every subscriber gets
+    its own bars of any timeframe and offset, kept up to date incrementally from that buffer. the history of a
+    series is only fetched once, the hub keeps it up to date from the feed and copies it for every new subscriber.
+    each bot keeps its own exchange interface for account, orders and executions (and gets its ticks from there),
+    the hub only saves the history requests and the bar building from it. if the feed dies, the next open one
+    takes over.
+    '''
+
+    def __init__(self, exchange: str, symbol: str):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.lock = threading.RLock()
+        self.subscribers: List[ExchangeInterface] = []
+        self.history = {}  # (timeframe, offset) -> (feed, builder with the fetched bars, kept up to date)
+
+    def subscribe(self, exchange: ExchangeInterface):
+        with self.lock:
+            self.subscribers.append(exchange)
+
+    def unsubscribe(self, exchange: ExchangeInterface):
+        with self.lock:
+            self.subscribers = [sub for sub in self.subscribers if sub is not exchange]
+            if len(self.subscribers) == 0:
+                self.history = {}
+
+    def feed(self) -> ExchangeInterface:
+        ''' the exchange interface that provides the market data: the first subscriber that is open '''
+        with self.lock:
+            for exchange in self.subscribers:
+                if exchange.is_open():
+                    return exchange
+        return None
+
+    def bars(self, timeframe_minutes: int, start_offset_minutes: int, min_bars_needed: int,
+             max_bars: int = None) -> LiveBarBuilder:
+        ''' a builder with the history of the series, to be kept up to date via update. the bars are owned by the
+        caller, so the bots can change them (bot_data, did_change) without interfering.
+        without an open feed, the builder has no bars (yet), the caller tries again on the next tick '''
+        with self.lock:
+            key = (timeframe_minutes, start_offset_minutes)
+            builder = LiveBarBuilder(timeframe_minutes, start_offset_minutes, max_bars=max_bars)
+            feed = self.feed()
+            if feed is None:
+                return builder
+            cached = self.history.get(key)
+            if cached is not None and cached[0] is feed and len(cached[1].bars) >= min_bars_needed:
+                history = cached[1]
+                feed.update_bars(history)
+            else:
+                # a different feed might not have the data since the last sync in its buffer: fetch again
+                history = LiveBarBuilder(timeframe_minutes, start_offset_minutes,
+                                         bars=feed.get_bars(timeframe_minutes, start_offset_minutes, min_bars_needed),
+                                         max_bars=max_bars)
+                self.history[key] = (feed, history)
+            builder.bars.extend(copy_bar(bar) for bar in history.bars)
+            if max_bars is not None:
+                del builder.bars[max_bars:]
+            for bar in builder.bars[builder.bars_with_subbars:]:
+                bar.subbars = []
+            return builder
+
+    def update(self, builder: LiveBarBuilder) -> bool:
+        ''' feeds the latest data of the feed into the builder, returns True if a bar changed.
+        the kept histories get synced too, so they are complete when the next subscriber copies them '''
+        feed = self.feed()
+        if feed is None:
+            return False
+        with self.lock:
+            for cached_feed, history in self.history.values():
+                if cached_feed is feed:
+                    feed.update_bars(history)
+        return feed.update_bars(builder)
+
+
+def hub_for(hubs: dict, settings) -> MarketDataHub:
+    ''' the hub for exchange and symbol of the settings, testnet and mainnet are kept apart '''
+    key = (settings.EXCHANGE, settings.SYMBOL, bool(settings.IS_TEST))
+    if key not in hubs:
+        hubs[key] = MarketDataHub(settings.EXCHANGE, settings.SYMBOL)
+    return hubs[key]
@@ -0,0 +1,107 @@
+import heapq
+import math
+
+from kuegi_bot.utils.trading_classes import Order
+
+
+class OrderBook:
+    ''' the open orders of a backtest by trigger price: buy stops, sell stops, buy limits and sell limits in separate
+    heaps, market orders in a dict. a stop-limit order moves to the limits once its stop got triggered.
+    like on an exchange, orders have to be changed via update, otherwise a new price is not seen.
+    removed or changed orders stay in the heaps till they come up (lazy deletion).
+    '''
+
+    def __init__(self):
+        # heap entries are (key, version, order), key is the price (negated for the max-heaps)
+        self.buy_stops = []
+        self.sell_stops = []
+        self.buy_limits = []
+        self.sell_limits = []
+        self.market = {}  # order id -> order
+        self.versions = {}  # order id -> version of the valid entry
+        self.seqs = {}  # order id -> position in the order of arrival, to keep ties in that order
+        self.next_version = 0
+
+    def __len__(self):
+        return len(self.versions)
+
+    def __contains__(self, order: Order):
+        return order.id in self.versions
+
+    def add(self, order: Order):
+        self.next_version += 1
+        self.seqs[order.id] = self.next_version
+        self._index(order)
+
+    def update(self, order: Order):
+        ''' the order got changed, it counts as new arrival (like when it gets replaced on the exchange) '''
+        self.remove(order)
+        self.add(order)
+
+    def reindex(self, order: Order):
+        ''' the trigger state of the order changed, it keeps its place in the order of arrival '''
+        self._index(order)
+
+    def remove(self, order: Order):
+        self.versions.pop(order.id, None)
+        self.seqs.pop(order.id, None)
+        self.market.pop(order.id, None)
+
+    def _index(self, order: Order):
+        self.next_version += 1
+        version = self.next_version
+        self.versions[order.id] = version
+        self.market.pop(order.id, None)
+        if order.stop_price and not order.stop_triggered:
+            if order.amount > 0:
+                heapq.heappush(self.buy_stops, (order.stop_price, version, order))
+            else:
+                heapq.heappush(self.sell_stops, (-order.stop_price, version, order))
+        elif order.limit_price is not None:
+            if order.amount > 0:
+                heapq.heappush(self.buy_limits, (-order.limit_price, version, order))
+            else:
+                heapq.heappush(self.sell_limits, (order.limit_price, version, order))
+        else:
+            self.market[order.id] = order
+
+    def _top(self, heap: list):
+        ''' key of the first valid entry, inf if there is none '''
+        while heap:
+            key, version, order = heap[0]
+            if self.versions.get(order.id) == version:
+                return key
+            heapq.heappop(heap)
+        return math.inf
+
+    def _crossed(self, heap: list, limit: float, result: list):
+        ''' adds all valid orders with key < limit to result '''
+        valid = []
+        while heap and heap[0][0] < limit:
+            entry = heapq.heappop(heap)
+            if self.versions.get(entry[2].id) == entry[1]:
+                valid.append(entry)
+                result.append(entry[2])
+        for entry in valid:
+            heapq.heappush(heap, entry)
+
+    def trigger_range(self):
+        ''' (up, down): a high above up or a low below down could trigger or fill an order.
+        None if there is a market order, so any price does '''
+        if self.market:
+            return None
+        up = min(self._top(self.buy_stops), self._top(self.sell_limits))
+        down = -min(self._top(self.sell_stops), self._top(self.buy_limits))
+        return up, down
+
+    def candidates(self, high: float, low: float) -> list:
+        ''' all orders that could get triggered or filled within high and low (in no specific order) '''
+        result = list(self.market.values())
+        self._crossed(self.buy_stops, high, result)
+        self._crossed(self.sell_limits, high, result)
+        self._crossed(self.sell_stops, -low, result)
+        self._crossed(self.buy_limits, -low, result)
+        return result
+
+    def seq(self, order: Order) -> int:
+        return self.seqs.get(order.id, 0)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import os
+from enum import Enum
+
+import numpy as np
+
+from kuegi_bot.utils.trading_classes import slot_values
+from kuegi_bot.utils.bar_store import SubbarView
+
+# attributes that are set from outside at runtime and don't change the result of a backtest
+RUNTIME_ATTRIBUTES = ("logger", "order_interface", "telegram", "storage", "indicator_registry")
+
+# increase if the result of a backtest on the same input changes, so old entries are not used anymore
+FORMAT_VERSION = 2
+
+
+def canonical(value, path: tuple = ()):
+    ''' json-compatible description of a value and everything it references: objects become their class name and
+    their attributes (without RUNTIME_ATTRIBUTES and private ones), dicts and sets get sorted '''
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, Enum):
+        return type(value).__name__ + "." + value.name
+    if isinstance(value, (list, tuple)):
+        return [canonical(item, path) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((canonical(item, path) for item in value), key=repr)
+    if isinstance(value, dict):
+        return sorted([[canonical(key, path), canonical(item, path)] for key, item in value.items()], key=repr)
+    if isinstance(value, logging.Logger):
+        return None
+    if id(value) in path:
+        return "<cycle>"
+    if hasattr(value, "__dict__") or hasattr(value, "__slots__"):
+        path = path + (id(value),)
+        attributes = vars(value) if hasattr(value, "__dict__") else slot_values(value)
+        return {"class": type(value).__module__ + "." + type(value).__qualname__,
+                "attributes": {name: canonical(item, path) for name, item in sorted(attributes.items())
+                               if name not in RUNTIME_ATTRIBUTES and not name.startswith("_")}}
+    if callable(value):
+        return getattr(value, "__module__", "") + "." + getattr(value, "__qualname__", repr(value))
+    return repr(value)
+
+
+def bars_fingerprint(bars: list) -> str:
+    ''' md5 of tstamp, ohlc and volume of all bars and their subbars '''
+    md5 = hashlib.md5()
+    fields = ("tstamp", "open", "high", "low", "close", "volume")
+    for bar in bars:
+        subbars = bar.subbars
+        if isinstance(subbars, SubbarView):
+            values = np.empty((len(subbars) + 1, len(fields)), dtype=np.float64)
+            values[0] = [getattr(bar, field) for field in fields]
+            for col, column in enumerate(subbars.columns(fields)):
+                values[1:, col] = column[::-1]  # newest first, like the list
+        else:
+            values = np.array([[getattr(bar, field) for field in fields]]
+                              + [[getattr(sub, field) for field in fields] for sub in subbars], dtype=np.float64)
+        md5.update(values.tobytes())
+    return md5.hexdigest()
+
+
+def fingerprint(description) -> str:
+    return hashlib.md5(json.dumps([FORMAT_VERSION, description]).encode()).hexdigest()
+
+
+class ResultCache:
+    ''' keeps the results of finished backtests on disk, one json file per fingerprint of the input.
+    if the files take more than max_size_mb, the least recently used ones get deleted.
+    '''
+
+    def __init__(self, directory: str, max_size_mb: float = 200):
+        self.directory = directory
+        self.max_size = max_size_mb * 1024 * 1024
+
+    def file_name(self, key: str):
+        return os.path.join(self.directory, key + ".json")
+
+    def load(self, key: str):
+        ''' the stored result or None '''
+        file_name = self.file_name(key)
+        try:
+            with open(file_name, "r") as file:
+                result = json.load(file)
+            os.utime(file_name)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def save(self, key: str, result: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = self.file_name(key)
+        temp_name = "%s.%d.tmp" % (file_name, os.getpid())  # sweeps save from several processes
+        with open(temp_name, "w") as file:
+            json.dump(result, file)
+        os.replace(temp_name, file_name)
+        self.evict()
+
+    def evict(self):
+        ''' deletes the least recently used results till the rest fits into max_size '''
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
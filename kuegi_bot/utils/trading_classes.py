@@ -5,9 +5,25 @@ from datetime import datetime
 
 import atexit
 from enum import Enum
+from operator import attrgetter
+
+import numpy as np
+
+
+def slot_values(obj) -> dict:
+    ''' the attributes that are set on an object with __slots__, like the __dict__ of a plain object '''
+    result = {}
+    for name in obj.__slots__:
+        try:
+            result[name] = object.__getattribute__(obj, name)
+        except AttributeError:
+            pass  # not set (yet)
+    return result
 
 
 class AccountPosition:
+    __slots__ = ("symbol", "quantity", "avgEntryPrice", "walletBalance")
+
     def __init__(self, symbol: str, quantity: float, avgEntryPrice: float, walletBalance: float = 0):
         self.symbol = symbol
         self.quantity = quantity
@@ -15,7 +31,7 @@ class AccountPosition:
         self.walletBalance = walletBalance
 
     def __str__(self):
-        return str(self.__dict__)
+        return str(slot_values(self))
 
 
 class TickerData:
@@ -29,6 +45,10 @@ class TickerData:
 
 
 class Bar:
+    # bot_data is only allocated on first access, most subbars never need it
+    __slots__ = ("tstamp", "open", "high", "low", "close", "volume", "buyVolume", "sellVolume", "subbars",
+                 "bot_data", "did_change", "last_tick_tstamp")
+
     def __init__(self, tstamp: int, open: float, high: float, low: float, close: float, volume: float,
                  subbars: list = None):
         self.tstamp: int = tstamp
@@ -40,11 +60,21 @@ class Bar:
         self.buyVolume: float = 0
         self.sellVolume: float = 0
         self.subbars: List[Bar] = subbars if subbars is not None else []
-        self.bot_data = {"indicators": {}}
         self.did_change: bool = True
         self.last_tick_tstamp: float = tstamp if subbars is None or len(subbars) == 0 else \
             subbars[0].last_tick_tstamp
 
+    def __getattr__(self, name):
+        # only called for attributes that are not set
+        if name == "bot_data":
+            self.bot_data = {"indicators": {}}
+            return self.bot_data
+        raise AttributeError("'Bar' object has no attribute '%s'" % name)
+
+    def __getstate__(self):
+        # without this, pickle would allocate bot_data via __getattr__
+        return None, slot_values(self)
+
     def __str__(self):
         result = "%s (%i) %.1f/%.1f\\%.1f-%.1f %.1f" % (
             datetime.fromtimestamp(self.tstamp), self.tstamp, self.open, self.high, self.low, self.close, self.volume)
@@ -125,6 +155,10 @@ class OrderType(Enum):
 
 
 class Order:
+    # final_tstamp and final_reason get set by the backtest once the order is done
+    __slots__ = ("id", "stop_price", "limit_price", "amount", "executed_amount", "executed_price", "active",
+                 "stop_triggered", "tstamp", "execution_tstamp", "exchange_id", "final_tstamp", "final_reason")
+
     def __init__(self, orderId=None, stop=None, limit=None, amount: float = 0):
         self.id = orderId
         self.stop_price = stop
@@ -192,6 +226,12 @@ class PositionStatus(Enum):
 
 
 class Position:
+    # markForCancel and waitingToFillSince are only set by some strategies (check with hasattr)
+    __slots__ = ("id", "signal_tstamp", "status", "changed", "wanted_entry", "initial_stop", "amount",
+                 "max_filled_amount", "current_open_amount", "last_filled_entry", "filled_entry", "filled_exit",
+                 "entry_tstamp", "exit_tstamp", "exit_equity", "custom_data", "connectedOrders", "stats",
+                 "markForCancel", "waitingToFillSince")
+
     def __init__(self, id: str, entry: float, stop: float, amount: float, tstamp):
         self.id: str = id
         self.signal_tstamp = tstamp
@@ -213,10 +253,10 @@ class Position:
         self.stats = {}
 
     def __str__(self):
-        return str(self.__dict__)
+        return str(slot_values(self))
 
     def to_json(self):
-        tempdic = dict(self.__dict__)
+        tempdic = slot_values(self)
         tempdic['status'] = self.status.value
         orders = tempdic['connectedOrders']
         tempdic['connectedOrders'] = []
@@ -224,13 +264,13 @@ class Position:
             if isinstance(order, dict):
                 tempdic['connectedOrders'].append(order)
             else:
-                tempdic['connectedOrders'].append(order.__dict__)
+                tempdic['connectedOrders'].append(slot_values(order))
         return tempdic
 
     @staticmethod
     def from_json(pos_json):
         pos = Position("", 0, 0, 0, 0)
-        for prop in pos.__dict__.keys():
+        for prop in slot_values(pos).keys():
             if prop in pos_json.keys():
                 setattr(pos, prop, pos_json[prop])
         # backward comp
@@ -271,12 +311,9 @@ def parse_utc_timestamp(timestamp: str) -> float:
     return calendar.timegm(d.timetuple()) + d.microsecond / 1000000.0
 
 
-def process_low_tf_bars(subbars: List[Bar], timeframe_minutes, start_offset_minutes=0):
-    ''' subbars need to be ordered newest bar = index 0 '''
+def _aggregate_stepwise(subbars: List[Bar], timeframe_minutes, start_offset_minutes=0):
+    ''' bar by bar, for subbars that are not in order or have bars without close '''
     result: list = []
-    if len(subbars) > 1 and subbars[0].tstamp < subbars[-1].tstamp:
-        print("Had to order subbars before processing them!")
-        subbars.sort(key=lambda b: b.tstamp, reverse=True)
     for bar in reversed(subbars):
         bar_start = int((bar.tstamp - start_offset_minutes * 60) / (60 * timeframe_minutes)) * (60 * timeframe_minutes)
         if result and result[-1].tstamp == bar_start:
@@ -295,6 +332,44 @@ def process_low_tf_bars(subbars: List[Bar], timeframe_minutes, start_offset_minu
     return result
 
 
+def process_low_tf_bars(subbars: List[Bar], timeframe_minutes, start_offset_minutes=0):
+    ''' subbars need to be ordered newest bar = index 0.
+    the bar starts of all subbars get calculated in one go, then every bar is built from its slice of the subbars.
+    a BarStore gets aggregated vectorized (BarStore.aggregate) '''
+    from kuegi_bot.utils.bar_store import BarStore  # not on top, it imports this module
+    if isinstance(subbars, BarStore):
+        return BarStore.aggregate(subbars, timeframe_minutes, start_offset_minutes)
+    if len(subbars) > 1 and subbars[0].tstamp < subbars[-1].tstamp:
+        print("Had to order subbars before processing them!")
+        subbars.sort(key=lambda b: b.tstamp, reverse=True)
+    if len(subbars) == 0:
+        return []
+    chronological = subbars[::-1]
+    tstamps = np.fromiter(map(attrgetter("tstamp"), chronological), dtype=np.float64, count=len(chronological))
+    if np.any(tstamps[1:] < tstamps[:-1]) or None in map(attrgetter("close"), chronological):
+        return _aggregate_stepwise(subbars, timeframe_minutes, start_offset_minutes)
+
+    seconds = 60 * timeframe_minutes
+    # same as int((tstamp - offset) / seconds) * seconds per subbar
+    bar_starts = (np.trunc((tstamps - start_offset_minutes * 60) / seconds) * seconds).astype(np.int64)
+    ends = np.append(np.flatnonzero(bar_starts[1:] != bar_starts[:-1]) + 1, len(bar_starts)).tolist()
+    high, low, volume, last_tick = attrgetter("high"), attrgetter("low"), attrgetter("volume"), \
+        attrgetter("last_tick_tstamp")
+    result: list = []
+    start = 0
+    for end in ends:
+        group = chronological[start:end]
+        first = group[0]
+        bar = Bar(tstamp=int(bar_starts[start]), open=first.open, high=max(map(high, group)),
+                  low=min(map(low, group)), close=group[-1].close, volume=sum(map(volume, group)),
+                  subbars=group[::-1])
+        bar.last_tick_tstamp = max(map(last_tick, group))
+        result.append(bar)
+        start = end
+    result.reverse()
+    return result
+
+
 class ExchangeInterface(OrderInterface):
     def __init__(self, settings, logger, on_tick_callback=None, on_execution_callback=None):
         self.settings = settings
@@ -362,6 +437,18 @@ class ExchangeInterface(OrderInterface):
     def recent_bars(self, timeframe_minutes, start_offset_minutes) -> List[Bar]:
         return []
 
+    def update_bars(self, builder) -> bool:
+        ''' feeds the latest data into the builder (LiveBarBuilder), returns True if a bar changed.
+        by default the subbars of the recent bars, exchanges with a buffer of low tf bars only feed what changed '''
+        changed = False
+        for bar in reversed(self.recent_bars(builder.timeframe_minutes, builder.start_offset_minutes)):
+            if len(builder.bars) > 0 and bar.tstamp < builder.bars[0].tstamp:
+                continue
+            for subbar in reversed(bar.subbars):
+                if builder.add(subbar):
+                    changed = True
+        return changed
+
     def get_instrument(self, symbol=None):
         pass
 
@@ -12,7 +12,7 @@ from kuegi_bot.exchanges.coinbase.coinbase_interface import CoinbaseInterface
 from kuegi_bot.exchanges.huobi.huobi_interface import HuobiInterface
 from kuegi_bot.exchanges.kraken.kraken_interface import KrakenInterface
 from kuegi_bot.utils.dotdict import dotdict
-from kuegi_bot.utils.trading_classes import Bar
+from kuegi_bot.utils.trading_classes import Bar, slot_values
 
 
 class VolubaData:
@@ -123,7 +123,7 @@ class VolubaAggregator:
                        'barsByExchange': {}
                        }
                 for ex, bar in d.barsByExchange.items():
-                    bard = dict(bar.__dict__)
+                    bard = slot_values(bar)
                     if "did_change" in bard:
                         del bard['did_change']
                     if "bot_data" in bard:
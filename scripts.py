@@ -4,14 +4,14 @@ from datetime import datetime
 
 from kuegi_bot.exchanges.bybit.bybit_interface import ByBitInterface
 from kuegi_bot.utils import log
-from kuegi_bot.utils.helper import known_history_files, load_settings_from_args
+from kuegi_bot.utils.helper import last_history_file_index, load_settings_from_args
 from kuegi_bot.utils.trading_classes import parse_utc_timestamp
 
 #'''
 
 def read_ref_bars(coin):
     bars= []
-    end = known_history_files["bitstamp_" +coin.lower()+"eur"]
+    end = last_history_file_index("bitstamp", coin.lower()+"eur")
     for i in range(end-20,end+1):
         with open("history/bitstamp/"+coin.lower()+"eur_M1_"+str(i)+".json") as f:
             bars += json.load(f)
@@ -137,7 +137,7 @@ print("done writing wallet history to file bybitHistory"+coin+".csv")
 '''
 
 bars = []
-end = known_history_files["bitstamp_eurusd"]
+end = last_history_file_index("bitstamp", "eurusd")
 for i in range(end - 20, end + 1):
     with open("history/bitstamp/eurusd_M1_" + str(i) + ".json") as f:
         bars += json.load(f)
@@ -21,6 +21,7 @@ setup(name='kuegi-bot',
           'websocket-client',
           'future',
           'plotly',
+          'numpy',
           'bybit'
       ],
       packages=find_packages(),